@@ -2,9 +2,28 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
+import bisect
+import codecs
 import csv
 import os
+import sys
+import json
+import logging
+import multiprocessing
+import hashlib
+import heapq
+import itertools
+import shutil
+import sqlite3
+import threading
+import time
+import queue
+import re
 import datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
 
 user_data = {}
 
@@ -14,6 +33,42 @@ company_file = 'company.csv'
 items_file = 'items.csv'
 orders_file = 'orders.csv'
 order_history_file = 'order_history.csv'
+orders_journal_file = 'orders.journal'
+sequences_file = 'sequences.csv'
+import_checkpoint_file = 'import_checkpoint.csv'
+database_file = 'shop.db'
+data_lock_file = 'shop.lock'
+
+# Хранилище: 'csv' или 'sqlite'. Если база уже создана мигратором
+# (python labakur.py --migrate), по умолчанию используется она.
+storage_backend = os.environ.get('SHOP_STORAGE') or ('sqlite' if os.path.exists(database_file) else 'csv')
+
+buyers_fieldnames = ['ID', 'Наименование', 'Адрес', 'Телефон', 'Аватарка', 'Логин', 'Пароль']
+company_fieldnames = ['ID', 'Логин', 'Пароль']
+items_fieldnames = ['ID', 'Название', 'Цена', 'Наличие', 'Описание', 'Доставка', 'Компания ID', 'Изображение']
+orders_fieldnames = ['ID', 'Наименование покупателя', 'Адрес', 'Статус', 'Название товара', 'Количество', 'Итоговая цена', 'Вариант доставки', 'Дата заказа', 'ID покупателя']
+order_history_fieldnames = orders_fieldnames + ['Дата доставки']
+sequences_fieldnames = ['Таблица', 'Значение']
+import_checkpoint_fieldnames = ['Файл', 'Размер', 'Изменён', 'Строк']
+
+# Таблицы SQLite для каждого CSV-файла и столбцы, по которым строятся индексы
+db_tables = {
+    buyers_file: ('buyers', buyers_fieldnames, ['Логин', 'Наименование']),
+    company_file: ('companies', company_fieldnames, ['Логин']),
+    items_file: ('items', items_fieldnames, ['Название']),
+    orders_file: ('orders', orders_fieldnames, ['Наименование покупателя', 'ID покупателя', 'Статус']),
+    order_history_file: ('order_history', order_history_fieldnames, ['Наименование покупателя', 'ID покупателя']),
+    sequences_file: ('sequences', sequences_fieldnames, []),
+    import_checkpoint_file: ('import_checkpoint', import_checkpoint_fieldnames, []),
+}
+
+# Сколько событий копится в журнале заказов до фонового сжатия в снимок
+journal_compact_threshold = 500
+
+# Отложенная запись: изменения сбрасываются на диск фоновым потоком после
+# паузы в write_behind_delay секунд, но не позже чем через write_behind_max_delay
+write_behind_delay = 0.5
+write_behind_max_delay = 5.0
 
 def center_window():
     root.update_idletasks()
@@ -43,30 +98,976 @@ def apply_styles(root):
               background=[('active', 'white')],
               foreground=[('active', 'black')])
 
-def load_csv(file_path):
+def open_database(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    for table, fieldnames, indexed in db_tables.values():
+        columns = ', '.join(f'"{name}" INTEGER PRIMARY KEY' if name == 'ID' else f'"{name}" TEXT' for name in fieldnames)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+        # Столбцы, добавленные после создания базы
+        existing = {row[1] for row in connection.execute(f'PRAGMA table_info({table})')}
+        for name in fieldnames:
+            if name not in existing:
+                connection.execute(f'ALTER TABLE {table} ADD COLUMN "{name}" TEXT')
+        for column in indexed:
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_{column}" ON {table} ("{column}")')
+    connection.commit()
+    return connection
+
+db_lock = threading.RLock()
+db_state = {'connection': None}
+
+def get_db():
+    if db_state['connection'] is None:
+        db_state['connection'] = open_database(database_file)
+    return db_state['connection']
+
+def db_query(file_path):
+    table, fieldnames, _ = db_tables[file_path]
+    columns = ', '.join(f'"{name}"' for name in fieldnames)
+    with db_lock:
+        rows = get_db().execute(f'SELECT {columns} FROM {table} ORDER BY "{fieldnames[0]}"').fetchall()
+    rows = [{name: '' if value is None else str(value) for name, value in zip(fieldnames, row)} for row in rows]
+    db_written[file_path] = db_row_values(file_path, rows)
+    return rows
+
+# Что сейчас лежит в таблицах базы: файл -> {ключ: значения строки}.
+# При записи сравнивается с памятью, и в базу уходят только изменённые строки.
+db_written = {}
+
+def db_row_values(file_path, rows):
+    fieldnames = db_tables[file_path][1]
+    values = (tuple(str(row.get(name, '')) for name in fieldnames) for row in rows)
+    return {row[0]: row for row in values}
+
+def db_write_changes(connection, file_path, rows):
+    # Возвращает новое содержимое таблицы; запоминать его можно только после фиксации
+    table, fieldnames, _ = db_tables[file_path]
+    written = db_written.get(file_path)
+    if written is None:
+        db_query(file_path)
+        written = db_written[file_path]
+    current = db_row_values(file_path, rows)
+    changed = [values for key, values in current.items() if written.get(key) != values]
+    removed = [key for key in written if key not in current]
+    # У служебных таблиц нет первичного ключа, поэтому замена - это удаление и вставка
+    connection.executemany(f'DELETE FROM {table} WHERE "{fieldnames[0]}" = ?',
+                           [(key,) for key in removed] + [(values[0],) for values in changed])
+    columns = ', '.join(f'"{name}"' for name in fieldnames)
+    placeholders = ', '.join('?' for _ in fieldnames)
+    connection.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', changed)
+    return current
+
+def db_upsert_rows(connection, file_path, rows):
+    table, fieldnames, _ = db_tables[file_path]
+    columns = ', '.join(f'"{name}"' for name in fieldnames)
+    placeholders = ', '.join('?' for _ in fieldnames)
+    connection.executemany(
+        f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})',
+        ([row.get(name, '') for name in fieldnames] for row in rows)
+    )
+
+def read_csv_file(file_path):
     if os.path.exists(file_path):
         with open(file_path, mode='r', newline='', encoding='utf-8') as file:
             reader = csv.DictReader(file)
             return list(reader)
     return []
 
-def save_csv(file_path, data, fieldnames):
+def write_csv_file(file_path, data, fieldnames, sync=False):
     with open(file_path, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
         writer.writeheader()
         writer.writerows(data)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+
+def fsync_directory(path='.'):
+    # На Windows каталог нельзя открыть для fsync, там переименование и так надёжно
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+# Транзакции над несколькими файлами. Новые версии таблиц пишутся во
+# временные файлы <таблица>.tmp, затем записывается маркер фиксации со
+# списком изменений, и только после этого файлы атомарно подменяются.
+# Маркер есть на диске -> транзакция при запуске доводится до конца,
+# маркера нет -> временные файлы удаляются. Одновременные транзакции
+# из разных потоков объединяются в одну группу с общими fsync.
+commit_marker_file = 'transaction.commit'
+commit_cond = threading.Condition()
+commit_state = {'leader': False, 'pending': []}
+
+def commit_transaction(writes=(), events=()):
+    # writes: [(файл, строки, столбцы)], events: события заказов для журнала
+    batch = {
+        'writes': [(file_path, list(data), fieldnames) for file_path, data, fieldnames in writes],
+        'events': list(events),
+        'done': False,
+        'error': None
+    }
+    with commit_cond:
+        commit_state['pending'].append(batch)
+        while not batch['done']:
+            if commit_state['leader']:
+                commit_cond.wait()
+                continue
+            # Этот поток становится ведущим и фиксирует всё, что накопилось
+            commit_state['leader'] = True
+            group = commit_state['pending']
+            commit_state['pending'] = []
+            commit_cond.release()
+            error = None
+            try:
+                write_transaction(group)
+            except Exception as e:
+                error = e
+            finally:
+                commit_cond.acquire()
+            for done in group:
+                done['done'] = True
+                done['error'] = error
+            commit_state['leader'] = False
+            commit_cond.notify_all()
+    if batch['error'] is not None:
+        raise batch['error']
+
+def write_transaction(group):
+    writes = {}
+    events = []
+    for batch in group:
+        for file_path, data, fieldnames in batch['writes']:
+            writes[file_path] = (data, fieldnames)  # более поздняя версия таблицы побеждает
+        events.extend(batch['events'])
+
+    if storage_backend == 'sqlite':
+        with db_lock:
+            connection = get_db()
+            written = {}
+            with connection:
+                for file_path, (data, fieldnames) in writes.items():
+                    written[file_path] = db_write_changes(connection, file_path, data)
+                for event in events:
+                    db_apply_order_event(connection, event)
+            db_written.update(written)
+            if events:
+                # Заказы меняются событиями в обход сравнения
+                db_written.pop(orders_file, None)
+                db_written.pop(order_history_file, None)
+        return
+
+    for file_path, (data, fieldnames) in writes.items():
+        write_csv_file(file_path + '.tmp', data, fieldnames, sync=True)
+    appends = []
+    if events:
+        journal_size = os.path.getsize(orders_journal_file) if os.path.exists(orders_journal_file) else 0
+        appends.append([orders_journal_file, journal_size, [json.dumps(event, ensure_ascii=False) for event in events]])
+    marker = {'replace': list(writes), 'append': appends}
+    with open(commit_marker_file, mode='w', encoding='utf-8') as file:
+        json.dump(marker, file, ensure_ascii=False)
+        file.flush()
+        os.fsync(file.fileno())
+    fsync_directory()
+    apply_commit_marker(marker)
+    os.remove(commit_marker_file)
+
+def apply_commit_marker(marker):
+    # Повторное применение безопасно: журнал обрезается до размера до транзакции
+    for file_path, size, lines in marker['append']:
+        with open(file_path, mode='ab') as file:
+            file.truncate(size)
+            file.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+            file.flush()
+            os.fsync(file.fileno())
+    for file_path in marker['replace']:
+        if os.path.exists(file_path + '.tmp'):
+            os.replace(file_path + '.tmp', file_path)
+    fsync_directory()
+
+def recover_transaction():
+    marker = None
+    if os.path.exists(commit_marker_file):
+        try:
+            with open(commit_marker_file, mode='r', encoding='utf-8') as file:
+                marker = json.load(file)
+        except ValueError:
+            marker = None  # маркер не дописан: транзакция не зафиксирована
+    if marker is not None:
+        apply_commit_marker(marker)
+    else:
+        for file_path in db_tables:
+            if os.path.exists(file_path + '.tmp'):
+                os.remove(file_path + '.tmp')
+    if os.path.exists(commit_marker_file):
+        os.remove(commit_marker_file)
+
+def load_csv(file_path):
+    if storage_backend == 'sqlite':
+        return db_query(file_path)
+    return read_csv_file(file_path)
+
+# Записи таблиц. Строки CSV разбираются один раз при загрузке, деньги
+# хранятся в копейках, а to_row() возвращает строку в исходных столбцах.
+def parse_money(text):
+    # '149.0', '50', '1200.00 руб.' -> копейки
+    text = str(text).replace('руб.', '').replace(',', '.').strip()
+    if not text:
+        return 0
+    return int((Decimal(text) * 100).to_integral_value())
+
+def format_money(kopecks):
+    return f"{kopecks // 100}.{kopecks % 100:02d}"
+
+def parse_optional_id(text):
+    return int(text) if str(text).strip() else None
+
+
+@dataclass(slots=True)
+class Buyer:
+    id: int
+    name: str
+    address: str
+    phone: str
+    avatar: str
+    login: str
+    password: str
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(int(row['ID']), row['Наименование'], row['Адрес'], row['Телефон'],
+                   row['Аватарка'], row['Логин'], row['Пароль'])
+
+    def to_row(self):
+        return {
+            'ID': str(self.id),
+            'Наименование': self.name,
+            'Адрес': self.address,
+            'Телефон': self.phone,
+            'Аватарка': self.avatar,
+            'Логин': self.login,
+            'Пароль': self.password
+        }
+
+
+@dataclass(slots=True)
+class Company:
+    id: int
+    login: str
+    password: str
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(int(row['ID']), row['Логин'], row['Пароль'])
+
+    def to_row(self):
+        return {'ID': str(self.id), 'Логин': self.login, 'Пароль': self.password}
+
+
+@dataclass(slots=True)
+class Item:
+    id: int
+    name: str
+    price: int  # копейки
+    stock: int
+    description: str
+    delivery: bool
+    company_id: int | None
+    image: str
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(int(row['ID']), row['Название'], parse_money(row['Цена']), int(row['Наличие'] or 0),
+                   row.get('Описание', ''), row.get('Доставка', '') != 'Нет',
+                   parse_optional_id(row.get('Компания ID', '')), row.get('Изображение', ''))
+
+    def to_row(self):
+        return {
+            'ID': str(self.id),
+            'Название': self.name,
+            'Цена': format_money(self.price),
+            'Наличие': str(self.stock),
+            'Описание': self.description,
+            'Доставка': 'Да' if self.delivery else 'Нет',
+            'Компания ID': '' if self.company_id is None else str(self.company_id),
+            'Изображение': self.image
+        }
+
+
+@dataclass(slots=True)
+class Order:
+    id: int
+    buyer_name: str
+    address: str
+    status: str
+    item_name: str
+    quantity: int
+    total: int  # копейки
+    delivery: str
+    order_date: str
+    delivery_date: str = ''
+    buyer_id: int | None = None
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(int(row['ID']), row['Наименование покупателя'], row['Адрес'], row['Статус'],
+                   row['Название товара'], int(row['Количество']), parse_money(row['Итоговая цена']),
+                   row['Вариант доставки'], row['Дата заказа'], row.get('Дата доставки') or '',
+                   parse_optional_id(row.get('ID покупателя') or ''))
+
+    def total_text(self):
+        return f"{format_money(self.total)} руб."
+
+    def to_row(self):
+        return {
+            'ID': str(self.id),
+            'Наименование покупателя': self.buyer_name,
+            'Адрес': self.address,
+            'Статус': self.status,
+            'Название товара': self.item_name,
+            'Количество': str(self.quantity),
+            'Итоговая цена': self.total_text(),
+            'Вариант доставки': self.delivery,
+            'Дата заказа': self.order_date,
+            'Дата доставки': self.delivery_date,
+            'ID покупателя': '' if self.buyer_id is None else str(self.buyer_id)
+        }
+
+
+# Данные загружаются в load_data(). При импорте модуля (например, рабочими
+# процессами пула) файлы данных не читаются и не восстанавливаются.
+buyers = []
+companies = []
+items = []
+orders = []
+order_history = []
+
+# Хеш-индексы поверх списков. Обновляются при каждой вставке и удалении,
+# поэтому поиск товара или заказа не требует прохода по всему списку.
+items_by_id = {}
+items_by_name = {}  # название -> товары с этим названием в порядке добавления
+orders_by_id = {}
+history_by_id = {}
+accounts_by_login = {}  # логин -> Buyer или Company, общий для обоих типов учётных записей
+buyer_ids_by_name = {}  # имя покупателя -> ID, для заказов, сохранённых до появления столбца ID покупателя
+orders_by_buyer = {}  # ID покупателя -> {ID заказа: заказ}
+history_by_buyer = {}
+orders_by_status = {}  # статус -> {ID заказа: заказ}, только текущие заказы
+orders_by_date = []  # (дата заказа, ID заказа) по возрастанию, только текущие заказы
+
+def index_item(item):
+    items_by_id[item.id] = item
+    items_by_name.setdefault(item.name, []).append(item)
+    index_search(item)
+    index_suggestion(item)
+
+def unindex_item(item):
+    items_by_id.pop(item.id, None)
+    same_name = [i for i in items_by_name.get(item.name, []) if i.id != item.id]
+    if same_name:
+        items_by_name[item.name] = same_name
+    else:
+        items_by_name.pop(item.name, None)
+    unindex_search(item)
+    unindex_suggestion(item)
+
+# Обратные индексы для поиска товаров по названию и описанию: слова
+# названия и триграммы слов обоих полей. Триграммы находят товар по
+# началу или части слова, слова названия поднимают точные совпадения выше.
+search_words = {}  # слово названия -> ID товаров
+search_trigrams = {}  # триграмма названия или описания -> ID товаров
+search_name_trigrams = {}  # триграмма названия -> ID товаров
+search_texts = {}  # ID -> (название, описание) в нормализованном виде
+search_word_re = re.compile(r'\w+')
+
+def search_normalize(text):
+    return text.lower().replace('ё', 'е')
+
+def text_trigrams(words):
+    # Слова через пробел с пробелами по краям: ' ab' - начало слова, 'b ' - конец
+    padded = f" {' '.join(words)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def search_keys(item):
+    name = search_normalize(item.name)
+    description = search_normalize(item.description)
+    name_words = search_word_re.findall(name)
+    name_grams = text_trigrams(name_words)
+    return name, description, set(name_words), name_grams, name_grams | text_trigrams(search_word_re.findall(description))
+
+def index_search(item):
+    name, description, words, name_grams, grams = search_keys(item)
+    search_texts[item.id] = (name, description)
+    for index, keys in ((search_words, words), (search_name_trigrams, name_grams), (search_trigrams, grams)):
+        for key in keys:
+            ids = index.get(key)
+            if ids is None:
+                index[key] = {item.id}
+            else:
+                ids.add(item.id)
+
+def unindex_search(item):
+    if search_texts.pop(item.id, None) is None:
+        return
+    _, _, words, name_grams, grams = search_keys(item)
+    for index, keys in ((search_words, words), (search_name_trigrams, name_grams), (search_trigrams, grams)):
+        for key in keys:
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(item.id)
+                if not ids:
+                    del index[key]
+
+# Подсказки названий при вводе: отсортированный список нормализованных
+# названий, диапазон префикса ищется бинарным поиском. Лучшие по остатку
+# на складе названия кэшируются для префиксов, как в узлах префиксного
+# дерева: список префикса собирается из списков префиксов на символ длиннее.
+# Изменение товара сбрасывает кэш только для префиксов его названия, и
+# пересчёт затрагивает один путь, а не весь диапазон.
+suggest_names = []  # нормализованные названия по алфавиту, без повторов
+suggest_originals = {}  # нормализованное название -> исходные названия
+suggest_cache = {}  # префикс -> лучшие названия
+suggest_limit = 10
+suggest_direct = 64  # диапазон не длиннее этого считается без разбиения
+suggest_cache_size = 100000
+
+def index_suggestion(item):
+    key = search_normalize(item.name)
+    originals = suggest_originals.get(key)
+    if originals is None:
+        suggest_originals[key] = {item.name}
+        bisect.insort(suggest_names, key)
+    else:
+        originals.add(item.name)
+    invalidate_suggestions(item.name)
+
+def unindex_suggestion(item):
+    key = search_normalize(item.name)
+    originals = suggest_originals.get(key)
+    if originals is not None and item.name not in items_by_name:
+        originals.discard(item.name)
+        if not originals:
+            del suggest_originals[key]
+            del suggest_names[bisect.bisect_left(suggest_names, key)]
+    invalidate_suggestions(item.name)
+
+def invalidate_suggestions(name):
+    # Вызывается и при изменении остатка: от него зависит порядок подсказок
+    key = search_normalize(name)
+    for end in range(1, len(key) + 1):
+        suggest_cache.pop(key[:end], None)
+
+def name_stock(name):
+    return sum(item.stock for item in items_by_name.get(name, ()))
+
+def prefix_suggestions(prefix, start, stop):
+    # Лучшие названия среди suggest_names[start:stop], начинающихся с prefix
+    names = suggest_cache.get(prefix)
+    if names is not None:
+        return names
+    if stop - start <= suggest_direct:
+        candidates = [name for key in suggest_names[start:stop] for name in suggest_originals[key]]
+    else:
+        candidates = []
+        if suggest_names[start] == prefix:
+            candidates.extend(suggest_originals[prefix])
+            start += 1
+        while start < stop:
+            child = suggest_names[start][:len(prefix) + 1]
+            child_stop = bisect.bisect_left(suggest_names, child + '\U0010ffff', start, stop)
+            candidates.extend(prefix_suggestions(child, start, child_stop))
+            start = child_stop
+    names = heapq.nlargest(suggest_limit, candidates, key=name_stock)
+    if len(suggest_cache) >= suggest_cache_size:
+        suggest_cache.clear()
+    suggest_cache[prefix] = names
+    return names
+
+def suggest_item_names(prefix):
+    prefix = search_normalize(prefix.strip())
+    if not prefix:
+        return []
+    names = suggest_cache.get(prefix)
+    if names is None:
+        start = bisect.bisect_left(suggest_names, prefix)
+        stop = bisect.bisect_left(suggest_names, prefix + '\U0010ffff', start)
+        names = prefix_suggestions(prefix, start, stop)
+    return names
+
+def index_account(account):
+    # При совпадении логинов в старых данных приоритет у покупателя, как и раньше
+    accounts_by_login.setdefault(account.login, account)
+    if isinstance(account, Buyer):
+        buyer_ids_by_name.setdefault(account.name, account.id)
+
+def index_order(order, by_buyer):
+    if order.buyer_id is None:
+        order.buyer_id = buyer_ids_by_name.get(order.buyer_name)
+    by_buyer.setdefault(order.buyer_id, {})[order.id] = order
+
+def unindex_order(order, by_buyer):
+    by_buyer.get(order.buyer_id, {}).pop(order.id, None)
+
+def index_order_query(order):
+    orders_by_status.setdefault(order.status, {})[order.id] = order
+    bisect.insort(orders_by_date, (order.order_date, order.id))
+
+def unindex_order_query(order):
+    orders_by_status.get(order.status, {}).pop(order.id, None)
+    position = bisect.bisect_left(orders_by_date, (order.order_date, order.id))
+    if position < len(orders_by_date) and orders_by_date[position] == (order.order_date, order.id):
+        del orders_by_date[position]
+
+# Журнал событий заказов: каждое изменение дописывается одной строкой,
+# а orders.csv и order_history.csv переписываются только при сжатии журнала.
+journal_lock = threading.Lock()
+journal_state = {'events': 0, 'compacting': False}
+
+def apply_order_event(event):
+    # Применение идемпотентно: повторное проигрывание хвоста журнала поверх
+    # снимка, который уже содержит эти события, даёт то же состояние.
+    if 'IDs' in event:
+        # Пакетное событие: одно изменение для многих заказов одной строкой журнала
+        for order_id in event['IDs']:
+            apply_order_event({**{key: value for key, value in event.items() if key != 'IDs'}, 'ID': order_id})
+        return
+    if 'orders' in event:
+        # Несколько заказов одной корзины
+        for row in event['orders']:
+            apply_order_event({'event': event['event'], 'ID': row['ID'], 'order': row})
+        return
+    order_id = int(event['ID'])
+    order = orders_by_id.get(order_id)
+    if event['event'] == 'created':
+        new_order = Order.from_row(event['order'])
+        if order is not None:
+            orders[orders.index(order)] = new_order
+            unindex_order(order, orders_by_buyer)
+            unindex_order_query(order)
+        else:
+            orders.append(new_order)
+        orders_by_id[order_id] = new_order
+        index_order(new_order, orders_by_buyer)
+        index_order_query(new_order)
+        notify_changed('orders', new_order)
+    elif order is None:
+        return
+    elif event['event'] == 'status':
+        # Переход между корзинами статусов за O(1)
+        orders_by_status.get(order.status, {}).pop(order.id, None)
+        order.status = event['Статус']
+        orders_by_status.setdefault(order.status, {})[order.id] = order
+        notify_changed('orders', order)
+    elif event['event'] == 'collected':
+        orders.remove(order)
+        del orders_by_id[order_id]
+        unindex_order(order, orders_by_buyer)
+        unindex_order_query(order)
+        order.delivery_date = event['Дата доставки']
+        archived = history_by_id.get(order_id)
+        if archived is not None:
+            order_history[order_history.index(archived)] = order
+            unindex_order(archived, history_by_buyer)
+        else:
+            order_history.append(order)
+        history_by_id[order_id] = order
+        index_order(order, history_by_buyer)
+        notify_removed('orders', order_id)
+        notify_changed('history', order)
+
+def db_apply_order_event(connection, event):
+    if 'IDs' in event:
+        for order_id in event['IDs']:
+            db_apply_order_event(connection, {**{key: value for key, value in event.items() if key != 'IDs'},
+                                              'ID': order_id})
+        return
+    if 'orders' in event:
+        db_upsert_rows(connection, orders_file, event['orders'])
+        return
+    order_id = int(event['ID'])
+    if event['event'] == 'created':
+        db_upsert_rows(connection, orders_file, [event['order']])
+    elif event['event'] == 'status':
+        connection.execute('UPDATE orders SET "Статус" = ? WHERE "ID" = ?', (event['Статус'], order_id))
+    elif event['event'] == 'collected':
+        archived = history_by_id.get(order_id)
+        if archived is not None:
+            db_upsert_rows(connection, order_history_file, [archived.to_row()])
+        connection.execute('DELETE FROM orders WHERE "ID" = ?', (order_id,))
+
+def record_order_event(event, tables=()):
+    # Событие применяется в памяти сразу, а в журнал попадает при ближайшем
+    # сбросе вместе с изменёнными таблицами (например, остатками товаров).
+    # Под write_behind_cond сжатие журнала не снимет список заказов посреди изменения.
+    with write_behind_cond:
+        apply_order_event(event)
+        write_behind['events'].append(event)
+        mark_dirty(*tables)
+
+# Отложенная запись. Обработчики кнопок только помечают таблицы изменёнными,
+# а фоновый поток объединяет серию изменений в одну транзакцию.
+write_behind_cond = threading.Condition()
+write_behind = {'dirty': set(), 'events': [], 'changed': 0.0, 'flush_now': False, 'thread': None}
+
+def table_rows(file_path):
+    # Строки таблицы в столбцах CSV
+    if file_path == sequences_file:
+        return [{'Таблица': name, 'Значение': str(value)} for name, value in sequences.items()]
+    if file_path == import_checkpoint_file:
+        return [{'Файл': path, 'Размер': str(checkpoint['size']), 'Изменён': str(checkpoint['mtime']),
+                 'Строк': str(checkpoint['rows'])} for path, checkpoint in import_checkpoints.items()]
+    records = {
+        buyers_file: buyers,
+        company_file: companies,
+        items_file: items,
+        orders_file: orders,
+        order_history_file: order_history,
+    }[file_path]
+    return [record.to_row() for record in records]
+
+table_fieldnames = {
+    buyers_file: buyers_fieldnames,
+    company_file: company_fieldnames,
+    items_file: items_fieldnames,
+    orders_file: orders_fieldnames,
+    order_history_file: order_history_fieldnames,
+    sequences_file: sequences_fieldnames,
+    import_checkpoint_file: import_checkpoint_fieldnames,
+}
 
-# Load existing data
-buyers = load_csv(buyers_file)
-companies = load_csv(company_file)
-items = load_csv(items_file)
-orders = load_csv(orders_file)
-order_history = load_csv(order_history_file)
+def mark_dirty(*file_paths):
+    with write_behind_cond:
+        write_behind['dirty'].update(file_paths)
+        write_behind['changed'] = time.monotonic()
+        if write_behind['thread'] is None:
+            write_behind['thread'] = threading.Thread(target=write_behind_worker, name='write-behind', daemon=True)
+            write_behind['thread'].start()
+        write_behind_cond.notify_all()
+
+def has_pending_writes():
+    return bool(write_behind['dirty'] or write_behind['events'])
+
+def take_pending_writes():
+    # Забирает накопленное вместе со строками таблиц на этот момент.
+    # Вызывать под journal_lock; при ошибке записи вернуть через restore_pending_writes.
+    with write_behind_cond:
+        dirty = write_behind['dirty']
+        events = write_behind['events']
+        write_behind['dirty'] = set()
+        write_behind['events'] = []
+        writes = [(file_path, table_rows(file_path), table_fieldnames[file_path])
+                  for file_path in dirty]
+    return dirty, events, writes
+
+def restore_pending_writes(dirty, events):
+    with write_behind_cond:
+        write_behind['dirty'].update(dirty)
+        write_behind['events'][:0] = events
+
+def flush():
+    # Синхронно записывает всё накопленное. journal_lock сохраняет порядок
+    # событий между сбросами и не даёт сжатию журнала вклиниться в запись.
+    with journal_lock:
+        dirty, events, writes = take_pending_writes()
+        if not writes and not events:
+            return
+        try:
+            commit_transaction(writes, events)
+        except Exception:
+            restore_pending_writes(dirty, events)
+            raise
+        journal_state['events'] += len(events)
+    if storage_backend == 'csv' and journal_state['events'] >= journal_compact_threshold:
+        schedule_journal_compaction()
+
+def request_flush():
+    # Сбросить изменения в фоне, не дожидаясь паузы
+    with write_behind_cond:
+        write_behind['flush_now'] = True
+        write_behind_cond.notify_all()
+
+def write_behind_worker():
+    while True:
+        with write_behind_cond:
+            while not has_pending_writes():
+                write_behind_cond.wait()
+            started = time.monotonic()
+            while not write_behind['flush_now']:
+                now = time.monotonic()
+                timeout = min(write_behind['changed'] + write_behind_delay, started + write_behind_max_delay) - now
+                if timeout <= 0:
+                    break
+                write_behind_cond.wait(timeout)
+            write_behind['flush_now'] = False
+        try:
+            flush()
+        except Exception as e:
+            print(f"Не удалось сохранить данные: {e}", file=sys.stderr)
+            time.sleep(write_behind_delay)
+
+def replay_orders_journal():
+    count = 0
+    for path in (orders_journal_file + '.old', orders_journal_file):
+        if not os.path.exists(path):
+            continue
+        with open(path, mode='rb+') as file:
+            valid_size = 0
+            for line in file:
+                # Оборванная при сбое последняя запись отбрасывается
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    break
+                apply_order_event(event)
+                valid_size += len(line)
+                count += 1
+            file.truncate(valid_size)
+    journal_state['events'] = count
+    if count >= journal_compact_threshold or os.path.exists(orders_journal_file + '.old'):
+        schedule_journal_compaction()
+
+def compact_orders_journal():
+    old_journal = orders_journal_file + '.old'
+    with journal_lock:
+        if os.path.exists(orders_journal_file):
+            if os.path.exists(old_journal):
+                # Предыдущее сжатие не завершилось: дописываем к его журналу
+                with open(orders_journal_file, mode='rb') as src, open(old_journal, mode='ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(orders_journal_file)
+            else:
+                os.replace(orders_journal_file, old_journal)
+        journal_state['events'] = 0
+        # Снимок в памяти уже содержит события, ещё не попавшие на диск, поэтому
+        # он фиксируется одной транзакцией с отложенными таблицами (остатками
+        # товаров). Сами эти события в журнал больше не нужны.
+        with write_behind_cond:
+            dirty, events, writes = take_pending_writes()
+            writes.append((orders_file, [order.to_row() for order in orders], orders_fieldnames))
+            writes.append((order_history_file, [order.to_row() for order in order_history],
+                           order_history_fieldnames))
+        try:
+            commit_transaction(writes=writes)
+        except Exception:
+            restore_pending_writes(dirty, events)
+            raise
+        if os.path.exists(old_journal):
+            os.remove(old_journal)
+
+def schedule_journal_compaction():
+    with write_behind_cond:
+        if journal_state['compacting']:
+            return
+        journal_state['compacting'] = True
 
-def generate_id(data):
-    if not data:
-        return 1
-    return max(int(item['ID']) for item in data) + 1
+    def run():
+        try:
+            compact_orders_journal()
+        finally:
+            with write_behind_cond:
+                journal_state['compacting'] = False
+
+    # Не daemon: при выходе интерпретатор дождётся записи снимка
+    threading.Thread(target=run, name='journal-compaction').start()
+
+def migrate_csv_to_sqlite():
+    # Разовый перенос CSV-файлов (вместе с журналом заказов) в базу SQLite
+    if storage_backend != 'csv':
+        print(f"Данные уже хранятся в {database_file}")
+        return
+    temp_file = database_file + '.tmp'
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    connection = open_database(temp_file)
+    with connection:
+        for file_path in db_tables:
+            db_upsert_rows(connection, file_path, table_rows(file_path))
+    connection.execute('PRAGMA journal_mode=DELETE')
+    connection.close()
+    os.replace(temp_file, database_file)
+    print(f"Перенесено в {database_file}: покупателей {len(buyers)}, компаний {len(companies)}, "
+          f"товаров {len(items)}, заказов {len(orders)}, в истории {len(order_history)}")
+
+def find_account(login, password):
+    account = accounts_by_login.get(login)
+    if account is None or account.password != password:
+        return None
+    return ('client' if isinstance(account, Buyer) else 'company'), account
+
+def find_item_by_name(item_name):
+    # Товары всегда целиком в памяти, поэтому индекс в памяти обслуживает оба хранилища
+    same_name = items_by_name.get(item_name)
+    return same_name[0] if same_name else None
+
+def find_item(item_id):
+    return items_by_id.get(item_id)
+
+def find_buyer_orders(buyer_id):
+    return list(orders_by_buyer.get(buyer_id, {}).values())
+
+def find_buyer_history(buyer_id):
+    return list(history_by_buyer.get(buyer_id, {}).values())
+
+search_limit = 200  # сколько лучших результатов поиска показывать
+
+def search_items(query, limit=search_limit):
+    # ID найденных товаров, лучшие первыми; None - в запросе нечего искать.
+    # Выдача по ярусам: все слова запроса - слова названия; все слова входят
+    # в название; остальные совпадения. Ярусы считаются операциями над
+    # множествами, а проверяются и упорядочиваются (по ID) только те товары,
+    # что попадают в первые limit результатов.
+    words = [word for word in search_word_re.findall(search_normalize(query)) if len(word) >= 2]
+    if not words:
+        return None
+    postings = []
+    name_postings = []
+    for word in words:
+        # Короткое слово ищется как начало слова, длинное - как любая его часть
+        grams = {gram for gram in text_trigrams([word]) if gram[-1] != ' '}
+        if len(word) >= 3:
+            grams = {gram for gram in grams if gram[0] != ' '}
+        for gram in grams:
+            ids = search_trigrams.get(gram)
+            if not ids:
+                return []
+            postings.append(ids)
+            name_postings.append(search_name_trigrams.get(gram, set()))
+    postings.sort(key=len)
+    candidates = postings[0].intersection(*postings[1:])
+    in_name = candidates.intersection(*name_postings)
+    exact = in_name.intersection(*(search_words.get(word, set()) for word in words))
+    rest = candidates - in_name
+
+    def name_has_words(item_id):
+        name = search_texts[item_id][0]
+        return all(word in name for word in words)
+
+    def text_has_words(item_id):
+        name, description = search_texts[item_id]
+        return all(word in name or word in description for word in words)
+
+    found = []
+    for tier, check in ((exact, None), (in_name - exact, name_has_words), (rest, text_has_words)):
+        heap = list(tier)
+        heapq.heapify(heap)
+        while heap and len(found) < limit:
+            item_id = heapq.heappop(heap)
+            if check is None or check(item_id):
+                found.append(item_id)
+            elif tier is not rest:
+                rest.add(item_id)  # триграммы названия совпали случайно, слова могут быть в описании
+        if len(found) >= limit:
+            break
+    return found
+
+def order_matches(order, status=None, date_from='', date_to='', buyer_id=None):
+    return ((not status or order.status == status)
+            and (not date_from or order.order_date >= date_from)
+            and (not date_to or order.order_date <= date_to)
+            and (buyer_id is None or order.buyer_id == buyer_id))
+
+def query_orders(status=None, date_from='', date_to='', buyer_id=None):
+    # Текущие заказы под все заданные условия (даты 'ГГГГ-ММ-ДД' включительно).
+    # Перебирается самый маленький из источников - корзина статуса, отрезок
+    # индекса дат или заказы покупателя, - так что запрос стоит O(результата),
+    # а не O(всех заказов).
+    sources = []
+    if status:
+        bucket = orders_by_status.get(status, {})
+        sources.append((len(bucket), bucket.values))
+    if date_from or date_to:
+        start = bisect.bisect_left(orders_by_date, (date_from,)) if date_from else 0
+        stop = bisect.bisect_right(orders_by_date, (date_to, sys.maxsize)) if date_to else len(orders_by_date)
+        sources.append((max(stop - start, 0), lambda: (orders_by_id[order_id]
+                                                       for _, order_id in orders_by_date[start:stop])))
+    if buyer_id is not None:
+        bucket = orders_by_buyer.get(buyer_id, {})
+        sources.append((len(bucket), bucket.values))
+    if not sources:
+        return list(orders)
+    _, source = min(sources, key=lambda pair: pair[0])
+    return [order for order in source() if order_matches(order, status, date_from, date_to, buyer_id)]
+
+# Счётчики ID по таблицам. Считываются один раз при загрузке и сохраняются
+# вместе с данными, поэтому ID удалённых записей не выдаются повторно.
+# Заказы и история заказов используют общий счётчик.
+sequences = {}
+
+def seed_sequences():
+    stored = {row['Таблица']: int(row['Значение']) for row in load_csv(sequences_file)}
+    for name, tables in (('buyers', [buyers]), ('companies', [companies]), ('items', [items]),
+                         ('orders', [orders, order_history])):
+        sequences[name] = max([stored.get(name, 0)] + [record.id for records in tables for record in records])
+
+def reserve_ids(name, count):
+    # Блок из count подряд идущих ID для массовой вставки
+    start = sequences[name] + 1
+    sequences[name] += count
+    mark_dirty(sequences_file)
+    return range(start, start + count)
+
+def next_id(name):
+    return reserve_ids(name, 1)[0]
+
+# Отметки незавершённых импортов: сколько строк файла уже сохранено.
+# Файл узнаётся по полному пути, размеру и времени изменения.
+import_checkpoints = {}
+
+def load_import_checkpoints():
+    for row in load_csv(import_checkpoint_file):
+        import_checkpoints[row['Файл']] = {'size': int(row['Размер']), 'mtime': int(row['Изменён']),
+                                           'rows': int(row['Строк'])}
+
+# Каждый процесс держит в памяти свою копию таблиц и счётчиков ID, поэтому
+# с одним каталогом данных одновременно работает только один процесс: окно
+# магазина или приём файлов (--watch). Второй запуск отказывается стартовать.
+def acquire_data_lock():
+    # Файл блокировки остаётся открытым до выхода; ОС снимает блокировку
+    # и после аварийного завершения. None - данные заняты другим процессом.
+    file = open(data_lock_file, mode='a+')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+def load_data():
+    global buyers, companies, items, orders, order_history
+    if storage_backend == 'csv':
+        recover_transaction()
+    buyers = [Buyer.from_row(row) for row in load_csv(buyers_file)]
+    companies = [Company.from_row(row) for row in load_csv(company_file)]
+    items = [Item.from_row(row) for row in load_csv(items_file)]
+    orders = [Order.from_row(row) for row in load_csv(orders_file)]
+    order_history = [Order.from_row(row) for row in load_csv(order_history_file)]
+    for item in items:
+        index_item(item)
+    for account in buyers + companies:
+        index_account(account)
+    for order in orders:
+        orders_by_id[order.id] = order
+        index_order(order, orders_by_buyer)
+        index_order_query(order)
+    for order in order_history:
+        history_by_id[order.id] = order
+        index_order(order, history_by_buyer)
+    if storage_backend == 'csv':
+        replay_orders_journal()
+    seed_sequences()
+    load_import_checkpoints()
 
 def show_frame(frame_name):
     frame = frames[frame_name]
@@ -87,22 +1088,259 @@ def show_frame(frame_name):
 
 
 def load_orders(tree):
-    tree.delete(*tree.get_children())  # Clear existing data
     if 'name' in user_data:
-        for order in orders:
-            if order['Наименование покупателя'] == user_data['name']:
-                tree.insert("", tk.END, values=(
-                    order.get('ID', ''),
-                    order.get('Название товара', ''),
-                    order.get('Количество', ''),
-                    order.get('Итоговая цена', ''),
-                    order.get('Дата заказа', ''),
-                    order.get('Статус', '')
-                ))
+        reload_tree(tree)
     else:
         messagebox.showerror("Ошибка", "Не удалось загрузить заказы: имя пользователя отсутствует.")
 
 
+# Кэш готовых миниатюр (LRU с ограничением по памяти). Ключ включает mtime
+# и размер файла, так что изменённая на диске картинка декодируется заново.
+thumbnail_size = (100, 100)
+thumbnail_cache_limit = 32 * 1024 * 1024  # байт
+thumbnail_cache = OrderedDict()
+thumbnail_cache_stats = {'hits': 0, 'misses': 0, 'bytes': 0}
+
+def thumbnail_key(path, size=thumbnail_size):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, size)
+
+def cache_thumbnail(key, photo):
+    thumbnail_cache[key] = photo
+    thumbnail_cache_stats['bytes'] += photo.width() * photo.height() * 4  # Tk хранит 4 байта на пиксель
+    while thumbnail_cache_stats['bytes'] > thumbnail_cache_limit and len(thumbnail_cache) > 1:
+        _, evicted = thumbnail_cache.popitem(last=False)
+        thumbnail_cache_stats['bytes'] -= evicted.width() * evicted.height() * 4
+
+def cached_thumbnail(key):
+    photo = thumbnail_cache.get(key)
+    if photo is not None:
+        thumbnail_cache.move_to_end(key)
+        thumbnail_cache_stats['hits'] += 1
+    else:
+        thumbnail_cache_stats['misses'] += 1
+    return photo
+
+# Декодирование картинок в пуле потоков. Готовые изображения забирает главный
+# поток через root.after: PhotoImage можно создавать только в потоке Tk.
+image_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='image')
+image_results = queue.Queue()
+image_requests = {'pending': 0, 'polling': False}
+placeholder_images = {}
+
+def make_thumbnail(path, size=thumbnail_size):
+    # Быстрое уменьшение: JPEG сразу декодируется в масштабе 1/2..1/8 через
+    # draft(), затем целочисленный reduce() и только последний шаг - LANCZOS.
+    # Запас в 2 раза от итогового размера сохраняет качество фильтра.
+    image = Image.open(path)
+    if image.format == 'JPEG':
+        image.draft(image.mode, (size[0] * 2, size[1] * 2))
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        # PNG и Tk не умеют CMYK, YCbCr, I;16 и т.п.: такие режимы приводятся к RGB(A)
+        image = image.convert('RGBA' if image.mode in ('1', 'P', 'LA', 'PA', 'La', 'RGBa') else 'RGB')
+    factor = min(image.width // (size[0] * 2), image.height // (size[1] * 2))
+    if factor > 1:
+        image = image.reduce(factor)
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+def benchmark_thumbnails(folders=('images', 'Фото товаров'), repeat=5):
+    # Сравнение make_thumbnail с прежним полным декодированием + LANCZOS
+    def full_decode(path):
+        return Image.open(path).resize(thumbnail_size, Image.Resampling.LANCZOS)
+
+    total_old = total_new = 0.0
+    print(f"{'Файл':40} {'было, мс':>10} {'стало, мс':>10} {'ускорение':>10}")
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path):
+                continue  # подкаталоги, например хранилище images/store
+            timings = []
+            for decode in (full_decode, make_thumbnail):
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    decode(path)
+                timings.append((time.perf_counter() - started) / repeat * 1000)
+            total_old += timings[0]
+            total_new += timings[1]
+            print(f"{path:40} {timings[0]:10.1f} {timings[1]:10.1f} {timings[0] / timings[1]:9.1f}x")
+    if total_new:
+        print(f"{'Итого':40} {total_old:10.1f} {total_new:10.1f} {total_old / total_new:9.1f}x")
+
+# Хранилище картинок с адресацией по содержимому: миниатюра исходного файла
+# лежит в images/store/<2 символа хеша>/<sha256>.png. Одинаковые файлы
+# сохраняются один раз, а одноимённые разные файлы не затирают друг друга.
+image_store_dir = 'images/store'
+import_report_limit = 20  # сколько ошибок импорта показывать в отчёте
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def store_image(source_path):
+    digest = file_digest(source_path)
+    stored_path = f"{image_store_dir}/{digest[:2]}/{digest}.png"
+    if not os.path.exists(stored_path):
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        temp_path = f"{stored_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            make_thumbnail(source_path).save(temp_path, format='PNG')
+            os.replace(temp_path, stored_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return stored_path
+
+def image_process_pool(max_workers):
+    # Процессы запускаются через spawn: fork из процесса, где уже работают потоки
+    # Tk, фоновой записи и image_executor, может зависнуть на чужой блокировке
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+def store_images(source_paths, pool=None):
+    # Картинки пакета обрабатываются в пуле процессов: декодирование и хеширование
+    # упираются в процессор, а GIL не даёт потокам работать параллельно.
+    # Возвращает {исходный путь: (путь в хранилище, ошибка)}, каждый файл один раз.
+    unique_paths = list(dict.fromkeys(path for path in source_paths if path and os.path.exists(path)))
+    results = {}
+    if not unique_paths:
+        return results
+    if pool is None:
+        with image_process_pool(min(os.cpu_count() or 1, len(unique_paths))) as pool:
+            return store_images(unique_paths, pool)
+    futures = {path: pool.submit(store_image, path) for path in unique_paths}
+    for path, future in futures.items():
+        try:
+            results[path] = (future.result(), None)
+        except Exception as e:
+            results[path] = ('', e)
+    return results
+
+def collect_orphan_images():
+    # Удаляет из хранилища файлы, на которые не ссылается ни товар, ни аватарка
+    flush()
+    referenced = {os.path.normpath(item.image) for item in items if item.image}
+    referenced.update(os.path.normpath(buyer.avatar) for buyer in buyers if buyer.avatar)
+    removed = freed = 0
+    for directory, _, filenames in os.walk(image_store_dir):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.normpath(path) not in referenced:
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+    return removed, freed
+
+def set_label_image(label, photo):
+    label.config(image=photo if photo is not None else '')
+    label.image = photo
+
+def cancel_thumbnail(label):
+    request = getattr(label, 'image_request', None)
+    if request is not None:
+        request['cancelled'] = True
+        request['future'].cancel()
+        label.image_request = None
+
+def show_thumbnail(label, path, size=thumbnail_size):
+    # Показывает миниатюру в label: из кэша сразу, иначе заглушку до окончания
+    # декодирования. Более ранний незавершённый запрос для label отменяется.
+    cancel_thumbnail(label)
+    if not path:
+        set_label_image(label, None)
+        return
+    try:
+        key = thumbnail_key(path, size)
+    except OSError as e:
+        set_label_image(label, None)
+        messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
+        return
+    photo = cached_thumbnail(key)
+    if photo is not None:
+        set_label_image(label, photo)
+        return
+    if size not in placeholder_images:
+        placeholder_images[size] = ImageTk.PhotoImage(Image.new('RGB', size, '#e0e0e0'))
+    set_label_image(label, placeholder_images[size])
+
+    request = {'label': label, 'key': key, 'cancelled': False}
+    request['future'] = image_executor.submit(make_thumbnail, path, size)
+    request['future'].add_done_callback(lambda future: image_results.put(request))
+    label.image_request = request
+    image_requests['pending'] += 1
+    if not image_requests['polling']:
+        image_requests['polling'] = True
+        root.after(10, deliver_thumbnails)
+
+def deliver_thumbnails():
+    while True:
+        try:
+            request = image_results.get_nowait()
+        except queue.Empty:
+            break
+        image_requests['pending'] -= 1
+        if request['cancelled']:
+            continue
+        label = request['label']
+        label.image_request = None
+        try:
+            image = request['future'].result()
+        except Exception as e:
+            set_label_image(label, None)
+            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
+            continue
+        photo = ImageTk.PhotoImage(image)
+        cache_thumbnail(request['key'], photo)
+        set_label_image(label, photo)
+    if image_requests['pending'] > 0:
+        root.after(20, deliver_thumbnails)
+    else:
+        image_requests['polling'] = False
+
+def store_image_async(label, source_path, on_stored):
+    # Хеширование и уменьшение полноразмерной картинки идут в image_executor,
+    # on_stored(путь в хранилище) вызывается в потоке Tk. Пока файл
+    # обрабатывается, в label заглушка; более поздняя загрузка отменяет раннюю.
+    cancel_thumbnail(label)
+    if thumbnail_size not in placeholder_images:
+        placeholder_images[thumbnail_size] = ImageTk.PhotoImage(Image.new('RGB', thumbnail_size, '#e0e0e0'))
+    set_label_image(label, placeholder_images[thumbnail_size])
+    future = image_executor.submit(store_image, source_path)
+    label.upload_future = future
+
+    def deliver():
+        if label.upload_future is not future:
+            return
+        if not future.done():
+            root.after(20, deliver)
+            return
+        label.upload_future = None
+        try:
+            stored_path = future.result()
+        except Exception as e:
+            set_label_image(label, None)
+            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
+            return
+        show_thumbnail(label, stored_path)
+        on_stored(stored_path)
+
+    root.after(20, deliver)
+
+def thumbnail_cache_info():
+    requests = thumbnail_cache_stats['hits'] + thumbnail_cache_stats['misses']
+    return {
+        'hits': thumbnail_cache_stats['hits'],
+        'misses': thumbnail_cache_stats['misses'],
+        'hit_rate': thumbnail_cache_stats['hits'] / requests if requests else 0.0,
+        'entries': len(thumbnail_cache),
+        'bytes': thumbnail_cache_stats['bytes'],
+    }
+
+
 def load_profile(name_entry, address_entry, number_entry, avatar_label):
     name_entry.delete(0, tk.END)
     name_entry.insert(0, user_data.get('name', ''))
@@ -112,26 +1350,20 @@ def load_profile(name_entry, address_entry, number_entry, avatar_label):
     number_entry.insert(0, user_data.get('number', ''))
     # Если есть сохраненный путь к изображению, отображаем его
     if 'avatar' in user_data and user_data['avatar']:
-        try:
-            image = Image.open(user_data['avatar'])
-            image = image.resize((100, 100), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            avatar_label.config(image=photo)
-            avatar_label.image = photo
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
+        show_thumbnail(avatar_label, user_data['avatar'])
 
 
 def upload_avatar(entry_widget, label_widget):
     filename = filedialog.askopenfilename(title="Select Avatar", filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.gif")])
     if filename:
-        image = Image.open(filename)
-        image = image.resize((100, 100), Image.Resampling.LANCZOS)
-        photo = ImageTk.PhotoImage(image)
-        label_widget.config(image=photo)
-        label_widget.image = photo  
-        entry_widget.delete(0, tk.END)
-        entry_widget.insert(0, filename)  
+        def on_stored(stored_path):
+            # Поле только для чтения: временно включаем, чтобы записать путь
+            entry_widget.config(state='normal')
+            entry_widget.delete(0, tk.END)
+            entry_widget.insert(0, stored_path)
+            entry_widget.config(state='disabled')
+
+        store_image_async(label_widget, filename, on_stored)
   
 
 
@@ -171,7 +1403,7 @@ def handle_registration(registration_type, name_entry, address_entry, number_ent
         return
 
     # Check if login already exists
-    if any(buyer['Логин'] == login for buyer in buyers) or any(company['Логин'] == login for company in companies):
+    if login in accounts_by_login:
         messagebox.showerror("Ошибка", "Логин уже существует.")
         return
 
@@ -181,30 +1413,22 @@ def handle_registration(registration_type, name_entry, address_entry, number_ent
             return
 
         # Add buyer data to CSV
-        new_id = generate_id(buyers)
-        buyers.append({
-            'ID': new_id,
-            'Наименование': name,
-            'Адрес': address,
-            'Телефон': number,
-            'Аватарка': avatar_path,  # Сохраняем путь к аватарке
-            'Логин': login,
-            'Пароль': password
-        })
-        save_csv(buyers_file, buyers, fieldnames=['ID', 'Наименование', 'Адрес', 'Телефон', 'Аватарка', 'Логин', 'Пароль'])
+        new_id = next_id('buyers')
+        buyer = Buyer(new_id, name, address, number, avatar_path, login, password)
+        buyers.append(buyer)
+        index_account(buyer)
+        mark_dirty(buyers_file)
     else:
         if key != "123":
             messagebox.showerror("Ошибка", "Неверный ключ для регистрации компании.")
             return
 
         # Add company data to CSV
-        new_id = generate_id(companies)
-        companies.append({
-            'ID': new_id,
-            'Логин': login,
-            'Пароль': password
-        })
-        save_csv(company_file, companies, fieldnames=['ID', 'Логин', 'Пароль'])
+        new_id = next_id('companies')
+        company = Company(new_id, login, password)
+        companies.append(company)
+        index_account(company)
+        mark_dirty(company_file)
 
     show_frame("authorization")
     messagebox.showinfo("Регистрация", "Регистрация прошла успешно. Теперь войдите в систему.")
@@ -218,37 +1442,41 @@ def handle_login(login_entry, password_entry):
     password = password_entry.get()
     apply_styles(root)
     
+    account = find_account(login, password)
+
     # Check if the user is a client
-    for buyer in buyers:
-        if buyer['Логин'] == login and buyer['Пароль'] == password:
-            user_data.update({
-                'ID': buyer['ID'],
-                'type': 'client',
-                'name': buyer['Наименование'],
-                'address': buyer['Адрес'],
-                'number': buyer['Телефон'],
-                'login': buyer['Логин'],
-                'password': buyer['Пароль'],
-                'avatar': buyer['Аватарка']  # Загружаем путь к аватарке
-            })
-            # Update the products view for the client
-            update_products_view(frames['buy_product'].tree)
-            show_frame("client_dashboard")
-            return
-    
+    if account and account[0] == 'client':
+        buyer = account[1]
+        user_data.update({
+            'ID': buyer.id,
+            'type': 'client',
+            'name': buyer.name,
+            'address': buyer.address,
+            'number': buyer.phone,
+            'login': buyer.login,
+            'password': buyer.password,
+            'avatar': buyer.avatar  # Загружаем путь к аватарке
+        })
+        # Корзина предыдущего клиента новому не достаётся
+        frames['buy_product'].reset_cart(buyer.id)
+        # Update the products view for the client
+        update_products_view(frames['buy_product'].tree)
+        show_frame("client_dashboard")
+        return
+
     # Check if the user is a company
-    for company in companies:
-        if company['Логин'] == login and company['Пароль'] == password:
-            user_data.update({
-                'ID': company['ID'],
-                'type': 'company',
-                'login': company['Логин'],
-                'password': company['Пароль'],
-                'name': company['Логин']  # Add a default 'name' key for company users
-            })
-            # Bind the load_orders function after login
-            show_frame("company_dashboard")
-            return
+    if account and account[0] == 'company':
+        company = account[1]
+        user_data.update({
+            'ID': company.id,
+            'type': 'company',
+            'login': company.login,
+            'password': company.password,
+            'name': company.login  # Add a default 'name' key for company users
+        })
+        # Bind the load_orders function after login
+        show_frame("company_dashboard")
+        return
 
     messagebox.showerror("Ошибка", "Неверный логин или пароль")
 
@@ -373,8 +1601,8 @@ def handle_add_item(name_entry, price_entry, stock_entry, description_entry, del
 
     # Validate price (numeric)
     try:
-        price = float(price)
-    except ValueError:
+        price = parse_money(price)
+    except (InvalidOperation, ValueError):
         messagebox.showerror("Ошибка", "Цена должна быть числом.")
         return
 
@@ -385,21 +1613,13 @@ def handle_add_item(name_entry, price_entry, stock_entry, description_entry, del
         messagebox.showerror("Ошибка", "Количество на складе должно быть целым числом.")
         return
     
-    new_id = generate_id(items)
-    items.append({
-        'ID': new_id,
-        'Название': name,
-        'Цена': price,
-        'Наличие': stock,
-        'Описание': description,
-        'Доставка': 'Да' if delivery else 'Нет',
-        'Компания ID': user_data['ID'],
-        'Изображение': image_path  # Сохраняем путь к изображению
-    })
-    save_csv(items_file, items, fieldnames=['ID', 'Название', 'Цена', 'Наличие', 'Описание', 'Доставка', 'Компания ID', 'Изображение'])
-    
-    # Update the products view
-    update_products_view(frames['products'].tree)
+    new_id = next_id('items')
+    item = Item(new_id, name, price, stock, description, bool(delivery), user_data['ID'],
+                image_path)  # Сохраняем путь к изображению
+    items.append(item)
+    index_item(item)
+    mark_dirty(items_file)
+    notify_changed('items', item)
     
     show_frame("company_dashboard")
     messagebox.showinfo("Добавление товара", "Товар успешно добавлен.")
@@ -408,34 +1628,89 @@ def handle_add_item(name_entry, price_entry, stock_entry, description_entry, del
 def upload_item_image(label_widget):
     filename = filedialog.askopenfilename(title="Select Item Image", filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.gif")])
     if filename:
-        image = Image.open(filename)
-        image = image.resize((100, 100), Image.Resampling.LANCZOS)
-        photo = ImageTk.PhotoImage(image)
-        label_widget.config(image=photo)
-        label_widget.image = photo
-        label_widget.image_path = filename  
+        store_image_async(label_widget, filename,
+                          lambda stored_path: setattr(label_widget, 'image_path', stored_path))
 
 
 
-def handle_place_order(item_name, quantity, delivery, address):
-    global orders, items
+delivery_fee = 200 * 100  # копейки, берётся один раз за заказ
 
+def parse_order_line(item_name, quantity):
+    # Строка заказа из полей ввода; ValueError с текстом для пользователя
     item_name = item_name.strip()
     quantity = quantity.strip()
 
     # Validate item name (not empty)
     if not item_name:
-        messagebox.showerror("Ошибка", "Название товара не может быть пустым.")
-        return
+        raise ValueError("Название товара не может быть пустым.")
 
     # Validate quantity (integer and greater than 0)
     try:
         quantity = int(quantity)
-        if quantity <= 0:
-            messagebox.showerror("Ошибка", "Количество должно быть больше нуля.")
-            return
     except ValueError:
-        messagebox.showerror("Ошибка", "Количество должно быть целым числом.")
+        raise ValueError("Количество должно быть целым числом.")
+    if quantity <= 0:
+        raise ValueError("Количество должно быть больше нуля.")
+
+    # Get the item details from the items list
+    item = find_item_by_name(item_name)
+    if not item:
+        raise ValueError("Товар не найден.")
+    return item, quantity
+
+def place_order(lines, delivery, address):
+    # lines: [(товар, количество)]. Остатки проверяются для всех строк сразу;
+    # заказы и новые остатки фиксируются одним событием, товары пишутся один раз.
+    # Возвращает текст ошибки или None.
+    needed = {}
+    for item, quantity in lines:
+        needed[item.id] = needed.get(item.id, 0) + quantity
+    for item_id, quantity in needed.items():
+        item = items_by_id.get(item_id)
+        if item is None:
+            return "Товар не найден."
+        # Check if there is enough stock
+        if item.stock < quantity:
+            return f"Недостаточное количество товара на складе: {item.name}."
+        # Check if the delivery option is valid for the item
+        if delivery == "Доставка" and not item.delivery:
+            return f"У товара «{item.name}» нет возможности доставки."
+
+    # Get the current date
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    rows = []
+    for index, ((item, quantity), new_id) in enumerate(zip(lines, reserve_ids('orders', len(lines)))):
+        # Calculate the total price (в копейках), доставка входит в первую строку
+        total_price = quantity * item.price
+        if delivery == "Доставка" and index == 0:
+            total_price += delivery_fee
+        rows.append(Order(new_id, user_data['name'], address, 'Размещен', item.name, quantity,
+                          total_price, delivery, current_date, buyer_id=user_data['ID']).to_row())
+
+    if len(rows) == 1:
+        event = {'event': 'created', 'ID': rows[0]['ID'], 'order': rows[0]}
+    else:
+        event = {'event': 'created', 'orders': rows}
+
+    # Заказы и новые остатки фиксируются вместе: под write_behind_cond фоновая
+    # запись не увидит новые остатки без события заказа, и сбой не оставит одно без другого
+    with write_behind_cond:
+        # Update the stock
+        for item_id, quantity in needed.items():
+            item = items_by_id[item_id]
+            item.stock -= quantity
+            invalidate_suggestions(item.name)
+        record_order_event(event, tables=[items_file])
+    for item_id in needed:
+        notify_changed('items', items_by_id[item_id])
+    return None
+
+def handle_place_order(item_name, quantity, delivery, address):
+    try:
+        line = parse_order_line(item_name, quantity)
+    except ValueError as e:
+        messagebox.showerror("Ошибка", str(e))
         return
 
     # Validate delivery (not empty)
@@ -443,57 +1718,26 @@ def handle_place_order(item_name, quantity, delivery, address):
         messagebox.showerror("Ошибка", "Вариант доставки не может быть пустым.")
         return
 
-    # Get the item details from the items list
-    item = next((i for i in items if i['Название'] == item_name), None)
-    if not item:
-        messagebox.showerror("Ошибка", "Товар не найден.")
+    error = place_order([line], delivery, address)
+    if error:
+        messagebox.showerror("Ошибка", error)
         return
 
-    # Check if there is enough stock
-    if int(item['Наличие']) < quantity:
-        messagebox.showerror("Ошибка", "Недостаточное количество товара на складе.")
-        return
+    messagebox.showinfo("Успех", "Заказ размещен успешно.")
+    show_frame("client_dashboard")
 
-    # Check if the delivery option is valid for the item
-    if delivery == "Доставка" and item['Доставка'] == "Нет":
-        messagebox.showerror("Ошибка", "У выбранного товара нет возможности доставки.")
+def handle_place_cart(cart, delivery, address):
+    if not cart:
+        messagebox.showerror("Ошибка", "Корзина пуста.")
         return
-
-    # Calculate the total price
-    total_price = int(quantity) * float(item['Цена'])
-    if delivery == "Доставка":
-        total_price += 200
-
-    # Get the current date
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-
-    # Create a new order
-    new_id = generate_id(orders)
-    new_order = {
-        'ID': new_id,
-        'Наименование покупателя': user_data['name'],
-        'Адрес': address,
-        'Статус': 'Размещен',
-        'Название товара': item_name,
-        'Количество': quantity,
-        'Итоговая цена': f"{total_price:.2f} руб.",
-        'Вариант доставки': delivery,
-        'Дата заказа': current_date
-    }
-    orders.append(new_order)
-    save_csv(orders_file, orders, fieldnames=['ID', 'Наименование покупателя', 'Адрес', 'Статус', 'Название товара', 'Количество', 'Итоговая цена', 'Вариант доставки', 'Дата заказа'])
-
-    # Update the stock
-    for i in items:
-        if i['ID'] == item['ID']:
-            i['Наличие'] = str(int(i['Наличие']) - quantity)
-            break
-
-    save_csv(items_file, items, fieldnames=['ID', 'Название', 'Цена', 'Наличие', 'Описание', 'Доставка', 'Компания ID', 'Изображение'])
-    
-    # Update the products view for the client
-    update_products_view(frames['buy_product'].tree)
-
+    if not delivery:
+        messagebox.showerror("Ошибка", "Вариант доставки не может быть пустым.")
+        return
+    error = place_order(cart, delivery, address)
+    if error:
+        messagebox.showerror("Ошибка", error)
+        return
+    cart.clear()
     messagebox.showinfo("Успех", "Заказ размещен успешно.")
     show_frame("client_dashboard")
 
@@ -503,38 +1747,108 @@ def create_orders_frame():
     frame = ttk.Frame(root)
     
     columns = ("№", "Товар", "Количество", "Итоговая цена", "Дата заказа", "Статус", "Клиент")
-    tree = ttk.Treeview(frame, columns=columns, show="headings")
-    for col in columns:
-        tree.heading(col, text=col)
-    tree.grid(row=0, column=0, padx=10, pady=10, columnspan=2)
+    tree = create_virtual_tree(frame, columns)
+    tree.container.grid(row=0, column=0, padx=10, pady=10, columnspan=2)
+    # Дерево показывает результат запроса по текущему фильтру
+    order_filter = {'status': None, 'date_from': '', 'date_to': '', 'buyer_id': None}
+    bind_tree(tree, 'orders', lambda: query_orders(**order_filter), company_order_values,
+              lambda order: order_matches(order, **order_filter))
+    reload_tree(tree)
     
     status_options = ["Размещен", "Заказ отправлен", "Заказ подтверждён", "Заказ доставлен"]
 
-    def update_order_status(order_id, new_status):
-        for order in orders:
-            if order['ID'] == order_id:
-                order['Статус'] = new_status
-                save_csv(orders_file, orders, fieldnames=['ID', 'Наименование покупателя', 'Адрес', 'Статус', 'Название товара', 'Количество', 'Итоговая цена', 'Вариант доставки', 'Дата заказа'])
-                load_company_orders(tree)
-                break
+    def update_order_status(order_ids, new_status):
+        # Все выбранные заказы меняются одним событием и одной записью на диск
+        order_ids = [str(order_id) for order_id in order_ids if int(order_id) in orders_by_id]
+        if len(order_ids) == 1:
+            record_order_event({'event': 'status', 'ID': order_ids[0], 'Статус': new_status})
+        elif order_ids:
+            record_order_event({'event': 'status', 'IDs': order_ids, 'Статус': new_status})
+            request_flush()
     
     def on_tree_select(event):
         selected_items = tree.selection()
         if selected_items:
             selected_item = selected_items[0]
             order_id = tree.item(selected_item, 'values')[0]
-            selected_order = next(order for order in orders if order['ID'] == order_id)
-            status_var.set(selected_order['Статус'])
+            selected_order = orders_by_id[int(order_id)]
+            status_var.set(selected_order.status)
     
     tree.bind('<<TreeviewSelect>>', on_tree_select)
 
     status_var = tk.StringVar()
     status_menu = ttk.Combobox(frame, textvariable=status_var, values=status_options)
     status_menu.grid(row=1, column=0, pady=10)
-    ttk.Button(frame, text="Обновить статус", command=lambda: update_order_status(tree.item(tree.selection()[0], 'values')[0], status_var.get()) if tree.selection() else messagebox.showerror("Ошибка", "Выберите заказ для обновления статуса")).grid(row=1, column=1, pady=10)
+    ttk.Button(frame, text="Обновить статус", command=lambda: update_order_status(selected_ids(tree), status_var.get()) if selected_ids(tree) else messagebox.showerror("Ошибка", "Выберите заказ для обновления статуса")).grid(row=1, column=1, pady=10)
 
     ttk.Button(frame, text="Назад", command=lambda: show_frame("company_dashboard")).grid(row=2, column=0, pady=10)
     ttk.Button(frame, text="Обновить", command=lambda: load_company_orders(tree)).grid(row=2, column=1, pady=10)
+
+    # Фильтр заказов
+    filter_frame = ttk.Frame(frame)
+    filter_frame.grid(row=3, column=0, columnspan=2, pady=10)
+    ttk.Label(filter_frame, text="Статус:").pack(side=tk.LEFT)
+    filter_status = ttk.Combobox(filter_frame, values=["Все"] + status_options, state='readonly', width=18)
+    filter_status.set("Все")
+    filter_status.pack(side=tk.LEFT, padx=5)
+    ttk.Label(filter_frame, text="С (ГГГГ-ММ-ДД):").pack(side=tk.LEFT)
+    filter_from = ttk.Entry(filter_frame, width=12)
+    filter_from.pack(side=tk.LEFT, padx=5)
+    ttk.Label(filter_frame, text="По:").pack(side=tk.LEFT)
+    filter_to = ttk.Entry(filter_frame, width=12)
+    filter_to.pack(side=tk.LEFT, padx=5)
+    ttk.Label(filter_frame, text="Клиент:").pack(side=tk.LEFT)
+    # Имена покупателей не уникальны, поэтому в списке рядом с именем логин,
+    # а фильтр идёт по ID покупателя
+    buyer_choices = {}
+
+    def fill_buyer_choices():
+        buyer_choices.clear()
+        buyer_choices.update((f"{buyer.name} ({buyer.login})", buyer.id) for buyer in buyers)
+        filter_buyer.config(values=["Все"] + sorted(buyer_choices))
+
+    filter_buyer = ttk.Combobox(filter_frame, width=28, postcommand=fill_buyer_choices)
+    filter_buyer.set("Все")
+    filter_buyer.pack(side=tk.LEFT, padx=5)
+    filter_count = ttk.Label(filter_frame, text="")
+
+    def apply_order_filter():
+        date_from = filter_from.get().strip()
+        date_to = filter_to.get().strip()
+        try:
+            for text in (date_from, date_to):
+                if text:
+                    datetime.date.fromisoformat(text)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Дата должна быть в формате ГГГГ-ММ-ДД.")
+            return
+        buyer_choice = filter_buyer.get().strip()
+        buyer_id = None
+        if buyer_choice and buyer_choice != "Все":
+            if buyer_choice not in buyer_choices:
+                fill_buyer_choices()  # клиент введён вручную или зарегистрировался позже
+            buyer_id = buyer_choices.get(buyer_choice)
+            if buyer_id is None:
+                messagebox.showerror("Ошибка", "Клиент не найден.")
+                return
+        status = filter_status.get()
+        order_filter.update({'status': None if status == "Все" else status, 'date_from': date_from,
+                             'date_to': date_to, 'buyer_id': buyer_id})
+        tree.binding['first'] = 0
+        reload_tree(tree)
+        filter_count.config(text=f"Найдено: {len(tree.binding['view'])}")
+
+    def reset_order_filter():
+        filter_status.set("Все")
+        filter_from.delete(0, tk.END)
+        filter_to.delete(0, tk.END)
+        filter_buyer.set("Все")
+        apply_order_filter()
+
+    ttk.Button(filter_frame, text="Применить", command=apply_order_filter).pack(side=tk.LEFT, padx=5)
+    ttk.Button(filter_frame, text="Сбросить", command=reset_order_filter).pack(side=tk.LEFT, padx=5)
+    ttk.Button(filter_frame, text="Выделить все", command=lambda: select_all(tree)).pack(side=tk.LEFT, padx=5)
+    filter_count.pack(side=tk.LEFT, padx=5)
     
     # Store the tree reference in the frame
     frame.tree = tree
@@ -545,34 +1859,24 @@ def create_orders_frame():
 
 
 def load_company_orders(tree):
-    tree.delete(*tree.get_children())  # Clear existing data
-    for order in orders:
-        tree.insert("", tk.END, values=(
-            order.get('ID', ''),
-            order.get('Название товара', ''),
-            order.get('Количество', ''),
-            order.get('Итоговая цена', ''),
-            order.get('Дата заказа', ''),
-            order.get('Статус', ''),
-            order.get('Наименование покупателя', '')
-        ))
+    reload_tree(tree)
 
 def delete_selected_item(tree):
-    selected_item = tree.selection()
-    if selected_item:
-        item = tree.item(selected_item, 'values')
-        item_id = item[0]
+    item_ids = set(selected_ids(tree))
+    if item_ids:
+        if len(item_ids) > 1 and not messagebox.askyesno("Удаление", f"Удалить выбранные товары ({len(item_ids)})?"):
+            return
 
-        # Удаление товара из списка
-        global items
-        items = [i for i in items if i['ID'] != item_id]
+        # Удаление товаров из списка одним проходом
+        removed = [item for item in items if item.id in item_ids]
+        items[:] = [item for item in items if item.id not in item_ids]
+        for item in removed:
+            unindex_item(item)
+            notify_removed('items', item.id)
 
         # Сохранение обновленного списка товаров в файл
-        save_csv(items_file, items, fieldnames=['ID', 'Название', 'Цена', 'Наличие', 'Описание', 'Доставка', 'Компания ID', 'Изображение'])
-
-        # Обновление таблицы
-        update_products_view(tree)
-        messagebox.showinfo("Успех", "Товар успешно удален.")
+        mark_dirty(items_file)
+        messagebox.showinfo("Успех", f"Удалено товаров: {len(removed)}.")
     else:
         messagebox.showerror("Ошибка", "Пожалуйста, выберите товар для удаления.")
 
@@ -581,30 +1885,14 @@ def create_products_frame():
     
     ttk.Label(frame, text="Товары").pack(pady=10)
     
-    tree = ttk.Treeview(frame, columns=("ID", "Название", "Цена", "Наличие", "Доставка", "Описание", "Изображение"), show='headings')
-    tree.heading("ID", text="ID")
-    tree.heading("Название", text="Название")
-    tree.heading("Цена", text="Цена")
-    tree.heading("Наличие", text="Наличие")
-    tree.heading("Доставка", text="Доставка")
-    tree.heading("Описание", text="Описание")
-    tree.heading("Изображение", text="Изображение")
-    tree.pack(pady=10)
-    
-    for item in items:
-        image_path = item.get('Изображение', '')
-        tree.insert("", tk.END, values=(
-            item.get('ID', ''),
-            item.get('Название', ''),
-            item.get('Цена', ''),
-            item.get('Наличие', ''), 
-            item.get('Доставка', ''),
-            item.get('Описание', ''),
-            image_path
-        ))
+    tree = create_virtual_tree(frame, ("ID", "Название", "Цена", "Наличие", "Доставка", "Описание", "Изображение"))
+    tree.container.pack(pady=10)
+    bind_tree(tree, 'items', lambda: items, item_values)
+    reload_tree(tree)
 
     ttk.Button(frame, text="Назад", command=lambda: show_frame("company_dashboard")).pack(side=tk.LEFT, padx=5, pady=10)
     ttk.Button(frame, text="Удалить", command=lambda: delete_selected_item(tree)).pack(side=tk.RIGHT, padx=5, pady=10)  # Кнопка удаления товара
+    ttk.Button(frame, text="Выделить все", command=lambda: select_all(tree)).pack(side=tk.RIGHT, padx=5, pady=10)
 
     frame.tree = tree
     
@@ -648,72 +1936,705 @@ def create_add_product_frame():
         name_entry, price_entry, stock_entry, description_entry, delivery_var, image_label
     )).grid(row=7, column=1, pady=10)
     ttk.Button(frame, text="Назад", command=lambda: show_frame("company_dashboard")).grid(row=7, column=0, pady=10)
-    ttk.Button(frame, text="Импорт", command=lambda: import_items()).grid(row=7, column=2, pady=10)
+    ttk.Button(frame, text="Импорт", command=lambda: import_items(frame)).grid(row=7, column=2, pady=10)
+    frame.import_upsert = tk.BooleanVar()
+    ttk.Checkbutton(frame, text="Обновлять существующие", variable=frame.import_upsert).grid(row=7, column=3, pady=10)
+
+    # Ход фонового импорта
+    frame.import_progress = ttk.Progressbar(frame, mode='determinate', length=250)
+    frame.import_progress.grid(row=8, column=0, columnspan=2, pady=5)
+    frame.import_cancel = ttk.Button(frame, text="Отмена", state=tk.DISABLED,
+                                     command=lambda: frame.import_job['cancel'].set())
+    frame.import_cancel.grid(row=8, column=2, pady=5)
+    frame.import_status = ttk.Label(frame, text="")
+    frame.import_status.grid(row=9, column=0, columnspan=3, pady=5)
+    frame.import_job = None
     
     return frame
 
-def import_items():
-    filename = filedialog.askopenfilename(title="Select File", filetypes=[("CSV Files", "*.csv")])
-    if filename:
+# Импорт товаров из файла. Строки читаются и обрабатываются порциями по
+# import_chunk_size; каждая порция сохраняется вместе с отметкой в
+# import_checkpoint.csv, поэтому прерванный импорт продолжается с места
+# остановки. Функции ниже не зависят от интерфейса.
+import_chunk_size = 200
+import_required_fields = {'Название', 'Цена', 'Наличие', 'Доставка', 'Описание', 'Изображение'}
+# Столбцы, по которым при обновлении каталога строка файла сопоставляется с товаром
+import_key_fields = ('Название', 'Компания ID')
+
+def import_key(item):
+    # Значения берутся из to_row(), чтобы товар из файла и из каталога сравнивались одинаково
+    row = item.to_row()
+    return tuple(row[field] for field in import_key_fields)
+
+def new_import_job(path, company_id=None, upsert=False):
+    # upsert: совпавшие по ключу товары обновляются, а не добавляются повторно
+    stat = os.stat(path)
+    job = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+           'company_id': company_id, 'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0,
+           'failures': [], 'index': None}
+    if upsert:
+        job['index'] = {}
+        for item in items:
+            job['index'].setdefault(import_key(item), item)
+    return job
+
+def import_resume_row(job):
+    # Сколько строк уже импортировано, если файл с тех пор не менялся
+    checkpoint = import_checkpoints.get(job['path'])
+    if checkpoint and checkpoint['size'] == job['size'] and checkpoint['mtime'] == job['mtime']:
+        return checkpoint['rows']
+    return 0
+
+# Чтение файлов импорта. Каждый формат лениво отдаёт пары (номер строки,
+# строка) со значениями в виде исходных ячеек, так что в памяти не бывает
+# больше одной порции. Формат выбирается по расширению файла.
+def check_import_header(fieldnames):
+    missing_fields = import_required_fields - set(fieldnames)
+    if missing_fields:
+        raise ValueError(f"Отсутствуют необходимые столбцы: {', '.join(sorted(missing_fields))}")
+
+def detect_csv_format(path):
+    # Кодировка и разделитель: выгрузки поставщиков бывают в cp1251, в UTF-16
+    # («Текст Юникод» из Excel) и с ';' вместо запятой. Без BOM пробуются UTF-8
+    # и cp1251, причём файл проверяется целиком заранее: иначе импорт
+    # оборвался бы на середине, когда часть порций уже записана.
+    with open(path, mode='rb') as file:
+        head = file.read(4)
+    if head.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        candidates = ['utf-32']
+    elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        candidates = ['utf-16']
+    else:
+        candidates = ['utf-8-sig', 'cp1251']
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        text = ''
         try:
-            with open(filename, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                required_fields = {'Название', 'Цена', 'Наличие', 'Доставка', 'Описание', 'Изображение'}
-                if not required_fields.issubset(reader.fieldnames):
-                    missing_fields = required_fields - set(reader.fieldnames)
-                    messagebox.showerror("Ошибка", f"Отсутствуют необходимые столбцы: {', '.join(missing_fields)}")
-                    return
-
-                for row in reader:
-                    item = {
-                        'ID': generate_id(items),  # Генерация уникального ID
-                        'Название': row['Название'],
-                        'Цена': row['Цена'],
-                        'Наличие': row['Наличие'],
-                        'Доставка': row['Доставка'],
-                        'Описание': row['Описание'],
-                        'Изображение': ''
-                    }
-
-                    image_path = row.get('Изображение', '')
-                    if image_path and os.path.exists(image_path):
-                        try:
-                            image = Image.open(image_path)
-                            image = image.resize((100, 100), Image.Resampling.LANCZOS)
-                            saved_image_path = os.path.join('images', os.path.basename(image_path))
-                            image.save(saved_image_path)
-                            item['Изображение'] = saved_image_path
-                        except Exception as e:
-                            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
-
-                    items.append(item)
-
-                save_csv(items_file, items, fieldnames=['ID', 'Название', 'Цена', 'Наличие', 'Описание', 'Доставка', 'Компания ID', 'Изображение'])
-                update_products_view(frames['products'].tree)
-
-            messagebox.showinfo("Информация", "Товары успешно импортированы.")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось импортировать товары: {e}")
+            with open(path, mode='rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    decoded = decoder.decode(block)
+                    text = text or decoded
+                decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        break
+    else:
+        raise ValueError("Не удалось определить кодировку файла: ожидается UTF-8, UTF-16 или cp1251")
+    try:
+        delimiter = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;\t').delimiter
+    except csv.Error:
+        delimiter = ','
+    return encoding, delimiter
+
+def read_csv_rows(path):
+    encoding, delimiter = detect_csv_format(path)
+    with open(path, newline='', encoding=encoding) as file:
+        reader = csv.DictReader(file, delimiter=delimiter)
+        check_import_header(reader.fieldnames or [])
+        yield from enumerate(reader, start=2)
+
+def read_jsonl_rows(path):
+    with open(path, encoding='utf-8-sig') as file:
+        for line, text in enumerate(file, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"Строка {line}: {e}")
+            if not isinstance(row, dict):
+                raise ValueError(f"Строка {line}: ожидается объект JSON")
+            yield line, row
+
+def read_xlsx_rows(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("Для импорта XLSX нужен пакет openpyxl")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        check_import_header(header)
+        for line, values in enumerate(rows, start=2):
+            if any(value is not None for value in values):
+                yield line, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+import_readers = {
+    '.csv': read_csv_rows,
+    '.jsonl': read_jsonl_rows,
+    '.xlsx': read_xlsx_rows,
+}
 
+def import_cell(value):
+    # Ячейки JSON и XLSX приводятся к тому же виду, что и в CSV
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Да' if value else 'Нет'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def read_import_rows(path):
+    reader = import_readers.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise ValueError(f"Неизвестный формат файла: {os.path.basename(path)}")
+    for line, row in reader(path):
+        yield line, {str(key).strip(): import_cell(value) for key, value in row.items() if key is not None}
+
+def count_import_rows(path):
+    return sum(1 for _ in read_import_rows(path))
+
+def read_import_chunks(path, start_row=0):
+    # Порции [(номер строки, строка)] вместе с обработанными картинками.
+    # Тяжёлая часть импорта, выполняется вне потока Tk.
+    rows = itertools.islice(read_import_rows(path), start_row, None)
+    pool = None
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, import_chunk_size))
+            if not chunk:
+                return
+            image_paths = [row.get('Изображение', '') for _, row in chunk]
+            # Пул запускается при первой порции с картинками, файлы без них обходятся без него
+            if pool is None and any(path and os.path.exists(path) for path in image_paths):
+                pool = image_process_pool(os.cpu_count() or 1)
+            yield chunk, store_images(image_paths, pool) if pool is not None else {}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def apply_import_chunk(job, chunk, stored_images):
+    new_items = []
+    new_keys = set()
+    updates = []
+    changed = []
+    for line, row in chunk:
+        try:
+            item = Item(0, row['Название'], parse_money(row['Цена']), int(row['Наличие']),
+                        row['Описание'], row['Доставка'] != 'Нет', job['company_id'], '')
+        except KeyError as e:
+            job['failures'].append(f"Строка {line}: нет поля {e}")
+            continue
+        except (InvalidOperation, ValueError, TypeError) as e:
+            job['failures'].append(f"Строка {line}: {e}")
+            continue
+        if job['index'] is not None:
+            key = import_key(item)
+            # Повтор строки, в том числе в этой же порции, - обновление
+            if key in job['index'] or key in new_keys:
+                updates.append(item)
+                continue
+            new_keys.add(key)
+        image_path = row.get('Изображение', '')
+        if image_path in stored_images:
+            item.image, error = stored_images[image_path]
+            if error is not None:
+                job['failures'].append(f"Строка {line}, {image_path}: {error}")
+        new_items.append(item)
+
+    # Под write_behind_cond фоновая запись не увидит товары порции без
+    # отметки о ней или отметку без товаров
+    with write_behind_cond:
+        for item, new_id in zip(new_items, reserve_ids('items', len(new_items))):
+            item.id = new_id
+            items.append(item)
+            index_item(item)
+            changed.append(item)
+            if job['index'] is not None:
+                job['index'].setdefault(import_key(item), item)
+        # Обновления после вставки: повторы из этой порции находят свой новый товар
+        for update in updates:
+            item = job['index'][import_key(update)]
+            if (item.price, item.stock) == (update.price, update.stock):
+                job['unchanged'] += 1
+            else:
+                item.price, item.stock = update.price, update.stock
+                invalidate_suggestions(item.name)
+                job['updated'] += 1
+                changed.append(item)
+        job['rows'] += len(chunk)
+        job['inserted'] += len(new_items)
+        import_checkpoints[job['path']] = {'size': job['size'], 'mtime': job['mtime'], 'rows': job['rows']}
+        mark_dirty(items_file, import_checkpoint_file)
+    request_flush()
+    for item in changed:
+        notify_changed('items', item)
+    return new_items
+
+def drop_import_checkpoint(path):
+    with write_behind_cond:
+        if import_checkpoints.pop(os.path.abspath(path), None) is not None:
+            mark_dirty(import_checkpoint_file)
+    request_flush()
+
+def finish_import(job):
+    # Файл импортирован до конца, отметка больше не нужна
+    drop_import_checkpoint(job['path'])
+
+def import_file(path, company_id=None, upsert=False, resume=True, cancel=None):
+    # Импорт без интерфейса; cancel - threading.Event для остановки между порциями
+    job = new_import_job(path, company_id, upsert)
+    if resume:
+        job['rows'] = import_resume_row(job)
+    for chunk, stored_images in read_import_chunks(path, job['rows']):
+        if cancel is not None and cancel.is_set():
+            break
+        apply_import_chunk(job, chunk, stored_images)
+    else:
+        finish_import(job)
+    return job
+
+def import_summary(job):
+    summary = f"Добавлено: {job['inserted']}"
+    if job['index'] is not None:
+        summary += f", обновлено: {job['updated']}, без изменений: {job['unchanged']}"
+    return summary
+
+def import_report(job):
+    report = '\n'.join(job['failures'][:import_report_limit])
+    if len(job['failures']) > import_report_limit:
+        report += f"\n... и ещё {len(job['failures']) - import_report_limit}"
+    return report
+
+# Приём файлов из папки без интерфейса (--watch). Папка опрашивается раз
+# в watch_interval секунд; файл берётся, когда его размер и время изменения
+# не менялись между двумя опросами, то есть запись в него закончена.
+# Взятый файл переименованием переносится в processing/, после импорта -
+# в done/ или failed/. Файлы, оставшиеся в processing/ после сбоя,
+# импортируются заново с последней отметки. Пока работает приём, окно
+# магазина с теми же данными не запустится, и наоборот (см. acquire_data_lock):
+# чтобы добавлять товары при открытом окне, пользуйтесь импортом в нём.
+watch_interval = 2.0
+watch_log = logging.getLogger('watch')
+
+def move_to_folder(path, folder):
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, os.path.basename(path))
+    if os.path.exists(target):
+        name, extension = os.path.splitext(os.path.basename(path))
+        target = os.path.join(folder, f"{name}.{time.strftime('%Y%m%d-%H%M%S')}{extension}")
+    os.replace(path, target)
+    return target
+
+def ingest_file(path, folder, company_id, upsert, seen_at):
+    started = time.monotonic()
+    try:
+        job = import_file(path, company_id, upsert)
+        flush()  # файл уходит в done/ только после записи данных
+    except Exception as e:
+        watch_log.error("%s: не импортирован: %s", os.path.basename(path), e)
+        drop_import_checkpoint(path)
+        move_to_folder(path, os.path.join(folder, 'failed'))
+        return
+    elapsed = time.monotonic() - started
+    move_to_folder(path, os.path.join(folder, 'done'))
+    watch_log.info("%s: строк %d за %.2f с (%.0f строк/с), задержка от появления %.2f с. %s",
+                   os.path.basename(path), job['rows'], elapsed, job['rows'] / elapsed if elapsed else 0,
+                   time.monotonic() - seen_at, import_summary(job))
+    if job['failures']:
+        watch_log.warning("%s: ошибок %d:\n%s", os.path.basename(path), len(job['failures']), import_report(job))
+
+def watch_folder(folder, company_id=None, upsert=False):
+    processing = os.path.join(folder, 'processing')
+    os.makedirs(processing, exist_ok=True)
+    watch_log.info("Слежу за папкой %s", os.path.abspath(folder))
+    for name in sorted(os.listdir(processing)):
+        ingest_file(os.path.join(processing, name), folder, company_id, upsert, time.monotonic())
+
+    seen = {}  # имя -> (размер, время изменения, когда замечен)
+    while True:
+        current = {}
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if (not entry.is_file() or entry.name.startswith('.')
+                        or os.path.splitext(entry.name)[1].lower() not in import_readers):
+                    continue
+                stat = entry.stat()
+                previous = seen.get(entry.name)
+                seen_at = previous[2] if previous else time.monotonic()
+                current[entry.name] = (stat.st_size, stat.st_mtime_ns, seen_at)
+                if previous is None or previous[:2] != (stat.st_size, stat.st_mtime_ns):
+                    continue
+                # Файл перестал меняться: забираем его. Если его уже забрал
+                # другой процесс, переименование просто не удастся.
+                claimed = os.path.join(processing, entry.name)
+                try:
+                    os.rename(entry.path, claimed)
+                except OSError:
+                    continue
+                del current[entry.name]
+                ingest_file(claimed, folder, company_id, upsert, seen_at)
+        seen = current
+        time.sleep(watch_interval)
+
+def import_items(frame):
+    if frame.import_job is not None:
+        return
+    filename = filedialog.askopenfilename(title="Select File", filetypes=[
+        ("Все поддерживаемые", "*.csv *.jsonl *.xlsx"), ("CSV Files", "*.csv"),
+        ("JSON Lines", "*.jsonl"), ("Excel", "*.xlsx")])
+    if not filename:
+        return
+    job = new_import_job(filename, user_data.get('ID'), frame.import_upsert.get())
+    done_rows = import_resume_row(job)
+    if done_rows and messagebox.askyesno(
+            "Импорт", f"Импорт этого файла был прерван после {done_rows} строк. Продолжить с места остановки?"):
+        job['rows'] = done_rows
+    job['cancel'] = threading.Event()
+    job['queue'] = queue.Queue(maxsize=2)  # рабочий поток не уходит далеко вперёд
+
+    def send(message):
+        while not job['cancel'].is_set():
+            try:
+                job['queue'].put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
 
+    def work():
+        try:
+            send(('total', count_import_rows(filename)))
+            for chunk, stored_images in read_import_chunks(filename, job['rows']):
+                if job['cancel'].is_set():
+                    return
+                send(('chunk', chunk, stored_images))
+            send(('done', None))
+        except Exception as e:
+            send(('error', e))
+
+    def end(title, text, show=messagebox.showinfo):
+        frame.import_job = None
+        frame.import_cancel.config(state=tk.DISABLED)
+        frame.import_status.config(text=text)
+        if job['failures']:
+            text += f"\n\nОшибки ({len(job['failures'])}):\n{import_report(job)}"
+            show = messagebox.showwarning
+        show(title, text)
+
+    def poll():
+        while True:
+            try:
+                message = job['queue'].get_nowait()
+            except queue.Empty:
+                break
+            if job['cancel'].is_set():
+                continue  # порции после отмены не применяются
+            if message[0] == 'total':
+                frame.import_progress.config(maximum=max(message[1], 1), value=job['rows'])
+            elif message[0] == 'chunk':
+                apply_import_chunk(job, message[1], message[2])
+                frame.import_progress.config(value=job['rows'])
+                frame.import_status.config(text=f"Обработано строк: {job['rows']}")
+            elif message[0] == 'done':
+                finish_import(job)
+                end("Информация", f"Товары успешно импортированы. {import_summary(job)}.")
+                return
+            else:
+                end("Ошибка", f"Не удалось импортировать товары: {message[1]}", messagebox.showerror)
+                return
+        if job['cancel'].is_set() and not job['thread'].is_alive():
+            end("Импорт", f"Импорт остановлен после {job['rows']} строк, его можно продолжить позже. "
+                          f"{import_summary(job)}.")
+            return
+        root.after(100, poll)
+
+    frame.import_job = job
+    frame.import_cancel.config(state=tk.NORMAL)
+    frame.import_progress.config(value=0)
+    frame.import_status.config(text="Импорт...")
+    job['thread'] = threading.Thread(target=work, name='import', daemon=True)
+    job['thread'].start()
+    root.after(100, poll)
+
+
+
+
+def item_values(item):
+    # Значения строки товара для Treeview
+    return (item.id, item.name, format_money(item.price), item.stock,
+            'Да' if item.delivery else 'Нет', item.description, item.image)
+
+
+def company_order_values(order):
+    return (order.id, order.item_name, order.quantity, order.total_text(), order.order_date,
+            order.status, order.buyer_name)
+
+def buyer_order_values(order):
+    return (order.id, order.item_name, order.quantity, order.total_text(), order.order_date, order.status)
+
+def history_values(order):
+    return (order.id, order.item_name, order.quantity, order.total_text(), order.order_date,
+            order.delivery_date)
+
+def is_current_buyer(order):
+    return user_data.get('type') == 'client' and order.buyer_id == user_data['ID']
+
+# Привязка Treeview к записям с виртуальной прокруткой. Записи дерева лежат
+# в отсортированном списке view из пар (ключ сортировки, ID), а в самом
+# Treeview есть только видимое окно строк плюс запас virtual_margin.
+# Строка получает iid = ID записи, поэтому при прокрутке и изменениях Tk
+# вставляет, меняет и удаляет только то, что действительно изменилось.
+# Сортировка и фильтр применяются к view, а не к строкам виджета.
+# Деревья регистрируются по виду записей и получают уведомления об изменениях.
+tree_views = {'items': [], 'orders': [], 'history': []}
+virtual_margin = 5
+search_delay = 250  # мс
+
+def create_virtual_tree(parent, columns):
+    # Дерево со своей полосой прокрутки; размещать нужно tree.container
+    container = ttk.Frame(parent)
+    tree = ttk.Treeview(container, columns=columns, show="headings")
+    for index, col in enumerate(columns):
+        tree.heading(col, text=col, command=lambda index=index: sort_tree(tree, index))
+    tree.scrollbar = ttk.Scrollbar(container, orient=tk.VERTICAL, command=lambda *args: scroll_tree(tree, *args))
+    tree.grid(row=0, column=0, sticky='nsew')
+    tree.scrollbar.grid(row=0, column=1, sticky='ns')
+    tree.container = container
+
+    def on_wheel(event):
+        if event.num == 4 or event.delta > 0:
+            scroll_tree(tree, 'scroll', -3, 'units')
+        else:
+            scroll_tree(tree, 'scroll', 3, 'units')
+        return 'break'
+
+    def on_click(event):
+        # Обычный щелчок по строке заменяет выделение: забываем и строки за
+        # пределами окна. С Ctrl или Shift выделение дополняется, как в Tk.
+        if not event.state & (0x0001 | 0x0004) and tree.identify_region(event.x, event.y) in ('cell', 'tree'):
+            tree.binding['selected'] = set()
+
+    tree.bind('<Button-1>', on_click)
+    tree.bind('<MouseWheel>', on_wheel)
+    tree.bind('<Button-4>', on_wheel)
+    tree.bind('<Button-5>', on_wheel)
+    page = int(tree['height'])
+    for key, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', -page), ('<Next>', page),
+                      ('<Home>', -sys.maxsize), ('<End>', sys.maxsize)):
+        tree.bind(key, lambda event, step=step: move_tree_cursor(tree, step))
+    return tree
+
+def bind_tree(tree, kind, records, values, match=lambda record: True):
+    # records() - все записи дерева, match(record) - место ли записи в дереве
+    tree.binding = {
+        'records': records, 'values': values, 'match': match, 'filter': None,
+        'sort_column': None, 'reverse': False, 'ranked': None, 'rank': None,
+        'view': [], 'keys': {}, 'by_id': {},  # iid -> ключ в view, iid -> запись
+        'first': 0, 'rows': {}, 'selected': set(), 'render_pending': False
+    }
+    tree_views[kind].append(tree)
 
+def sort_value(value):
+    # Числа и суммы вида '149.00 руб.' сравниваются как числа, остальное как текст
+    if isinstance(value, (int, float)):
+        return (0, value, '')
+    try:
+        return (0, float(str(value).replace('руб.', '').strip()), '')
+    except ValueError:
+        return (1, 0, str(value).lower())
+
+def view_key(binding, record):
+    if binding['sort_column'] is not None:
+        return sort_value(binding['values'](record)[binding['sort_column']]), record.id
+    if binding['rank'] is not None:
+        return binding['rank'][record.id], record.id
+    return (), record.id
+
+def in_view(binding, record):
+    return (binding['match'](record) and (binding['filter'] is None or binding['filter'](record))
+            and (binding['rank'] is None or record.id in binding['rank']))
+
+def window_size(tree):
+    return int(tree['height']) + virtual_margin
+
+def view_slice(binding, start, stop):
+    # Отрезок view в порядке показа с учётом обратной сортировки
+    view = binding['view']
+    if not binding['reverse']:
+        return view[start:stop]
+    count = len(view)
+    return view[max(count - stop, 0):max(count - start, 0)][::-1]
+
+def view_position(binding, iid):
+    position = bisect.bisect_left(binding['view'], binding['keys'][iid])
+    return len(binding['view']) - 1 - position if binding['reverse'] else position
+
+def add_to_view(binding, record):
+    iid = str(record.id)
+    drop_from_view(binding, iid)
+    if in_view(binding, record):
+        key = view_key(binding, record)
+        bisect.insort(binding['view'], key)
+        binding['keys'][iid] = key
+        binding['by_id'][iid] = record
+
+def drop_from_view(binding, iid):
+    key = binding['keys'].pop(iid, None)
+    if key is not None:
+        del binding['view'][bisect.bisect_left(binding['view'], key)]
+        del binding['by_id'][iid]
+
+def upsert_row(tree, record):
+    add_to_view(tree.binding, record)
+    schedule_render(tree)
+
+def remove_row(tree, record_id):
+    drop_from_view(tree.binding, str(record_id))
+    tree.binding['selected'].discard(str(record_id))
+    if tree.binding['rank'] is not None:
+        tree.binding['rank'].pop(record_id, None)
+    schedule_render(tree)
+
+def reload_tree(tree):
+    binding = tree.binding
+    source = binding['ranked'] if binding['rank'] is not None else binding['records']()
+    records = [record for record in source if in_view(binding, record)]
+    keys = {str(record.id): view_key(binding, record) for record in records}
+    binding['by_id'] = {str(record.id): record for record in records}
+    binding['keys'] = keys
+    binding['view'] = sorted(keys.values())
+    render_window(tree)
+
+def sort_tree(tree, column):
+    binding = tree.binding
+    binding['reverse'] = binding['sort_column'] == column and not binding['reverse']
+    binding['sort_column'] = column
+    binding['keys'] = {iid: view_key(binding, record) for iid, record in binding['by_id'].items()}
+    binding['view'] = sorted(binding['keys'].values())
+    binding['first'] = 0
+    render_window(tree)
+
+def filter_tree(tree, predicate=None):
+    # Отбор записей выполняется над источником данных, а не над строками виджета
+    tree.binding['filter'] = predicate
+    tree.binding['first'] = 0
+    reload_tree(tree)
+
+def rank_tree(tree, ranked_records=None):
+    # Показать только ranked_records в заданном порядке (результаты поиска);
+    # None возвращает все записи. Новые записи в выдачу не попадают.
+    binding = tree.binding
+    binding['ranked'] = ranked_records
+    binding['rank'] = None if ranked_records is None else {
+        record.id: position for position, record in enumerate(ranked_records)}
+    binding['sort_column'] = None
+    binding['reverse'] = False
+    binding['first'] = 0
+    reload_tree(tree)
+
+def select_record(tree, record_id):
+    # Прокрутить дерево к записи и выделить её; False - записи нет в дереве
+    binding = tree.binding
+    iid = str(record_id)
+    if iid not in binding['keys']:
+        return False
+    binding['first'] = view_position(binding, iid) - int(tree['height']) // 2
+    render_window(tree)
+    binding['selected'] = {iid}
+    tree.selection_set(iid)
+    tree.focus(iid)
+    return True
+
+def schedule_render(tree):
+    # Серия изменений подряд перерисовывает окно один раз
+    if not tree.binding['render_pending']:
+        tree.binding['render_pending'] = True
+        tree.after_idle(render_window, tree)
+
+def sync_selection(tree):
+    # Выделение строк окна берём из Tk, выделение за пределами окна помним сами
+    binding = tree.binding
+    binding['selected'] = {iid for iid in binding['selected'] if iid not in binding['rows']}
+    binding['selected'].update(iid for iid in tree.selection() if iid in binding['keys'])
+
+def selected_ids(tree):
+    # ID всех выделенных записей, в том числе прокрученных за пределы окна
+    sync_selection(tree)
+    return sorted(int(iid) for iid in tree.binding['selected'] if iid in tree.binding['keys'])
+
+def select_all(tree):
+    # Выделить все записи дерева с учётом фильтра
+    tree.binding['selected'] = set(tree.binding['keys'])
+    tree.selection_set(tree.get_children())
+
+def render_window(tree):
+    binding = tree.binding
+    binding['render_pending'] = False
+    rows = binding['rows']
+    sync_selection(tree)
+    count = len(binding['view'])
+    binding['first'] = max(0, min(binding['first'], count - int(tree['height'])))
+    window = [str(record_id) for _, record_id in view_slice(binding, binding['first'],
+                                                            binding['first'] + window_size(tree))]
+    wanted = set(window)
+    for iid in [iid for iid in rows if iid not in wanted]:
+        del rows[iid]
+        tree.delete(iid)
+    for index, iid in enumerate(window):
+        values = binding['values'](binding['by_id'][iid])
+        if iid not in rows:
+            tree.insert("", index, iid=iid, values=values)
+        elif rows[iid] != values:
+            tree.item(iid, values=values)
+        rows[iid] = values
+    if list(tree.get_children()) != window:
+        for index, iid in enumerate(window):
+            tree.move(iid, "", index)
+    selection = [iid for iid in window if iid in binding['selected']]
+    if set(tree.selection()) != set(selection):
+        tree.selection_set(selection)
+    tree.yview_moveto(0)
+    if hasattr(tree, 'scrollbar'):
+        if count:
+            tree.scrollbar.set(binding['first'] / count, min(1.0, (binding['first'] + int(tree['height'])) / count))
+        else:
+            tree.scrollbar.set(0, 1)
+
+def scroll_tree(tree, action, amount, unit=None):
+    binding = tree.binding
+    if action == 'moveto':
+        binding['first'] = int(float(amount) * len(binding['view']))
+    elif unit == 'pages':
+        binding['first'] += int(amount) * int(tree['height'])
+    else:
+        binding['first'] += int(amount)
+    render_window(tree)
+
+def move_tree_cursor(tree, step):
+    # Перемещение выделения клавишами с подгрузкой окна на его границе
+    binding = tree.binding
+    count = len(binding['view'])
+    if not count:
+        return 'break'
+    focus = tree.focus()
+    position = view_position(binding, focus) if focus in binding['keys'] else binding['first']
+    position = max(0, min(count - 1, position + step))
+    height = int(tree['height'])
+    if position < binding['first']:
+        binding['first'] = position
+    elif position >= binding['first'] + height:
+        binding['first'] = position - height + 1
+    render_window(tree)
+    iid = str(view_slice(binding, position, position + 1)[0][1])
+    binding['selected'] = {iid}
+    tree.selection_set(iid)
+    tree.focus(iid)
+    return 'break'
+
+def notify_changed(kind, record):
+    for tree in tree_views[kind]:
+        upsert_row(tree, record)
+
+def notify_removed(kind, record_id):
+    for tree in tree_views[kind]:
+        remove_row(tree, record_id)
 
 def update_products_view(tree):
-    # Clear the existing items in the tree view
-    tree.delete(*tree.get_children())
-    
-    # Re-populate the tree view with the updated items
-    for item in items:
-        image_path = item.get('Изображение', '')
-        tree.insert("", tk.END, values=(
-            item.get('ID', ''),
-            item.get('Название', ''),
-            item.get('Цена', ''),
-            item.get('Наличие', ''),
-            item.get('Доставка', ''),
-            item.get('Описание', ''),
-            image_path
-        ))
+    reload_tree(tree)
 
 
 def create_buy_product_frame():
@@ -722,22 +2643,37 @@ def create_buy_product_frame():
     ttk.Label(frame, text="Купить товар").grid(row=0, column=1, pady=10)
     
     columns = ("ID", "Название", "Цена", "Наличие", "Доставка", "Описание", "Изображение")
-    tree = ttk.Treeview(frame, columns=columns, show="headings")
-    for col in columns:
-        tree.heading(col, text=col)
-    tree.grid(row=1, column=0, columnspan=2, padx=10, pady=10)
-    
-    for item in items:
-        image_path = item.get('Изображение', '')
-        tree.insert("", tk.END, values=(
-            item.get('ID', ''),
-            item.get('Название', ''),
-            item.get('Цена', ''),
-            item.get('Наличие', ''),
-            item.get('Доставка', ''),
-            item.get('Описание', ''),
-            image_path
-        ))
+    tree = create_virtual_tree(frame, columns)
+    tree.container.grid(row=1, column=0, columnspan=2, padx=10, pady=10)
+    bind_tree(tree, 'items', lambda: items, item_values)
+    reload_tree(tree)
+
+    # Поиск запускается, когда пользователь перестал печатать на search_delay мс
+    search_frame = ttk.Frame(frame)
+    search_frame.grid(row=0, column=0, pady=10)
+    ttk.Label(search_frame, text="Поиск:").pack(side=tk.LEFT)
+    search_var = tk.StringVar()
+    ttk.Entry(search_frame, textvariable=search_var).pack(side=tk.LEFT, padx=5)
+    search_status = ttk.Label(search_frame, text="")
+    search_status.pack(side=tk.LEFT)
+    search_state = {'after': None}
+
+    def run_search():
+        search_state['after'] = None
+        found = search_items(search_var.get())
+        if found is None:
+            rank_tree(tree, None)
+            search_status.config(text="")
+        else:
+            rank_tree(tree, [items_by_id[item_id] for item_id in found])
+            search_status.config(text=f"Найдено: {len(found)}")
+
+    def on_search_change(*args):
+        if search_state['after'] is not None:
+            frame.after_cancel(search_state['after'])
+        search_state['after'] = frame.after(search_delay, run_search)
+
+    search_var.trace_add('write', on_search_change)
 
     def on_item_select(event):
         selected_item = tree.selection()
@@ -752,18 +2688,7 @@ def create_buy_product_frame():
     tree.bind('<<TreeviewSelect>>', on_item_select)
     
     def display_image(image_path):
-        if image_path:
-            try:
-                image = Image.open(image_path)
-                image = image.resize((100, 100), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
-                image_label.config(image=photo)
-                image_label.image = photo
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
-        else:
-            image_label.config(image='')
-            image_label.image = None
+        show_thumbnail(image_label, image_path)
 
     def update_total_price(*args):
         try:
@@ -773,9 +2698,8 @@ def create_buy_product_frame():
                 return
             selected_item = tree.selection()
             if selected_item:
-                item = tree.item(selected_item, 'values')
-                price = float(item[2])
-                total_price_var.set(f"{quantity * price:.2f} руб.")
+                item = find_item(int(tree.item(selected_item, 'values')[0]))
+                total_price_var.set(f"{format_money(quantity * item.price)} руб.")
             else:
                 total_price_var.set("Выберите товар")
         except ValueError:
@@ -792,6 +2716,49 @@ def create_buy_product_frame():
     item_name_entry = ttk.Entry(frame)
     item_name_entry.grid(row=2, column=1, pady=5)
 
+    # Выпадающий список подсказок под полем названия
+    suggestions = tk.Listbox(frame, height=suggest_limit)
+
+    def hide_suggestions(event=None):
+        suggestions.place_forget()
+
+    def on_name_key(event):
+        if event.keysym == 'Escape' or event.keysym == 'Return':
+            hide_suggestions()
+            return
+        if event.keysym == 'Down':
+            if suggestions.winfo_ismapped():
+                suggestions.focus_set()
+                suggestions.selection_set(0)
+                suggestions.activate(0)
+            return
+        names = suggest_item_names(item_name_entry.get())
+        if not names:
+            hide_suggestions()
+            return
+        suggestions.delete(0, tk.END)
+        suggestions.insert(tk.END, *names)
+        suggestions.config(height=len(names))
+        suggestions.place(in_=item_name_entry, x=0, rely=1.0, relwidth=1.0)
+        suggestions.lift()
+
+    def pick_suggestion(event=None):
+        selection = suggestions.curselection()
+        if selection:
+            name = suggestions.get(selection[0])
+            item_name_entry.delete(0, tk.END)
+            item_name_entry.insert(0, name)
+            item = find_item_by_name(name)
+            if item is not None:
+                select_record(tree, item.id)
+        hide_suggestions()
+        item_name_entry.focus_set()
+
+    item_name_entry.bind('<KeyRelease>', on_name_key)
+    suggestions.bind('<Return>', pick_suggestion)
+    suggestions.bind('<ButtonRelease-1>', pick_suggestion)
+    suggestions.bind('<Escape>', lambda event: (hide_suggestions(), item_name_entry.focus_set()))
+
     ttk.Label(frame, text="Количество:").grid(row=3, column=0, pady=5)
     quantity_entry = ttk.Entry(frame)
     quantity_entry.grid(row=3, column=1, pady=5)
@@ -818,16 +2785,73 @@ def create_buy_product_frame():
     ttk.Button(frame, text="Подтвердить", command=lambda: handle_place_order(
         item_name_entry.get(), quantity_entry.get(), delivery_entry.get(), address_entry.get()
     )).grid(row=8, column=1, pady=10)
+
+    # Корзина: несколько товаров оформляются одним заказом.
+    # Корзина принадлежит вошедшему клиенту и очищается при смене клиента.
+    cart = []  # [(товар, количество)]
+    cart_state = {'owner': None}
+    cart_frame = ttk.Frame(frame)
+    cart_frame.grid(row=2, column=2, rowspan=7, padx=10, sticky='n')
+    ttk.Label(cart_frame, text="Корзина").pack()
+    cart_list = tk.Listbox(cart_frame, width=40, height=8)
+    cart_list.pack(pady=5)
+    cart_total_var = tk.StringVar()
+    ttk.Label(cart_frame, textvariable=cart_total_var).pack()
+
+    def refresh_cart(*args):
+        cart_list.delete(0, tk.END)
+        for item, quantity in cart:
+            cart_list.insert(tk.END, f"{item.name} x {quantity} = {format_money(quantity * item.price)} руб.")
+        total = sum(quantity * item.price for item, quantity in cart)
+        if cart and delivery_entry.get() == "Доставка":
+            total += delivery_fee
+        cart_total_var.set(f"Итого: {format_money(total)} руб." if cart else "")
+
+    def reset_cart(owner):
+        cart.clear()
+        cart_state['owner'] = owner
+        refresh_cart()
+
+    def add_to_cart():
+        try:
+            item, quantity = parse_order_line(item_name_entry.get(), quantity_entry.get())
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        in_cart = sum(q for i, q in cart if i.id == item.id)
+        if item.stock < in_cart + quantity:
+            messagebox.showerror("Ошибка", "Недостаточное количество товара на складе.")
+            return
+        cart.append((item, quantity))
+        refresh_cart()
+
+    def remove_from_cart():
+        for index in reversed(cart_list.curselection()):
+            del cart[index]
+        refresh_cart()
+
+    def checkout():
+        handle_place_cart(cart, delivery_entry.get(), address_entry.get())
+        refresh_cart()
+
+    ttk.Button(cart_frame, text="В корзину", command=add_to_cart).pack(fill=tk.X)
+    ttk.Button(cart_frame, text="Убрать из корзины", command=remove_from_cart).pack(fill=tk.X)
+    ttk.Button(cart_frame, text="Оформить корзину", command=checkout).pack(fill=tk.X)
+    delivery_entry.bind('<<ComboboxSelected>>', refresh_cart)
     ttk.Button(frame, text="Назад", command=lambda: show_frame("client_dashboard")).grid(row=8, column=0, pady=10)
     
     frame.tree = tree
     frame.address_entry = address_entry
+    frame.cart_state = cart_state
+    frame.reset_cart = reset_cart
     
     return frame
 
 
 
 def load_buy_product_frame():
+    if frames['buy_product'].cart_state['owner'] != user_data.get('ID'):
+        frames['buy_product'].reset_cart(user_data.get('ID'))
     frames['buy_product'].address_entry.delete(0, tk.END)
     frames['buy_product'].address_entry.insert(0, user_data.get('address', ''))
 
@@ -870,14 +2894,7 @@ def load_profile(name_entry, address_entry, number_entry, avatar_label):
     number_entry.delete(0, tk.END)
     number_entry.insert(0, user_data.get('number', ''))
     if 'avatar' in user_data and user_data['avatar']:
-        try:
-            image = Image.open(user_data['avatar'])
-            image = image.resize((100, 100), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            avatar_label.config(image=photo)
-            avatar_label.image = photo
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {e}")
+        show_thumbnail(avatar_label, user_data['avatar'])
 
 
 
@@ -885,10 +2902,10 @@ def create_order_status_frame():
     frame = ttk.Frame(root)
     
     columns = ("№", "Товар", "Количество", "Итоговая цена", "Дата заказа", "Статус")
-    tree = ttk.Treeview(frame, columns=columns, show="headings")
-    for col in columns:
-        tree.heading(col, text=col)
-    tree.grid(row=0, column=0, padx=10, pady=10, columnspan=2)
+    tree = create_virtual_tree(frame, columns)
+    tree.container.grid(row=0, column=0, padx=10, pady=10, columnspan=2)
+    bind_tree(tree, 'orders', lambda: find_buyer_orders(user_data['ID']) if 'ID' in user_data else [],
+              buyer_order_values, is_current_buyer)
     
     # Store the tree reference in the frame
     frame.tree = tree
@@ -898,16 +2915,14 @@ def create_order_status_frame():
         if selected_items:
             selected_item = selected_items[0]
             order_id = frames['order_status'].tree.item(selected_item, 'values')[0]
-            order = next(order for order in orders if order['ID'] == order_id)
-            if order['Статус'] == 'Заказ доставлен':
-            # Remove order from orders list
-                orders.remove(order)
-            # Add order to history
-                order['Дата доставки'] = datetime.datetime.now().strftime("%Y-%m-%d")
-                order_history.append(order)
-                save_csv(orders_file, orders, fieldnames=['ID', 'Наименование покупателя', 'Адрес', 'Статус', 'Название товара', 'Количество', 'Итоговая цена', 'Вариант доставки', 'Дата заказа'])
-                save_csv(order_history_file, order_history, fieldnames=['ID', 'Наименование покупателя', 'Адрес', 'Статус', 'Название товара', 'Количество', 'Итоговая цена', 'Вариант доставки', 'Дата заказа', 'Дата доставки'])
-                load_orders(frames['order_status'].tree)
+            order = orders_by_id[int(order_id)]
+            if order.status == 'Заказ доставлен':
+                # Move order from orders list to history
+                record_order_event({
+                    'event': 'collected',
+                    'ID': str(order.id),
+                    'Дата доставки': datetime.datetime.now().strftime("%Y-%m-%d")
+                })
                 messagebox.showinfo("Успех", "Заказ успешно забран и перемещен в историю заказов.")
             else:
                 messagebox.showerror("Ошибка", "Заказ ещё не доставлен.")
@@ -923,24 +2938,15 @@ def create_order_history_frame():
     frame = ttk.Frame(root)
     
     columns = ("№", "Товар", "Количество", "Итоговая цена", "Дата заказа", "Дата доставки")
-    tree = ttk.Treeview(frame, columns=columns, show="headings")
-    for col in columns:
-        tree.heading(col, text=col)
-    tree.grid(row=0, column=0, padx=10, pady=10)
+    tree = create_virtual_tree(frame, columns)
+    tree.container.grid(row=0, column=0, padx=10, pady=10)
     
+    bind_tree(tree, 'history', lambda: find_buyer_history(user_data['ID']) if 'ID' in user_data else [],
+              history_values, is_current_buyer)
+
     def load_order_history():
-        tree.delete(*tree.get_children())  # Clear existing data
         if 'name' in user_data:
-            for order in order_history:
-                if order['Наименование покупателя'] == user_data['name']:
-                    tree.insert("", tk.END, values=(
-                        order.get('ID', ''),
-                        order.get('Название товара', ''),
-                        order.get('Количество', ''),
-                        order.get('Итоговая цена', ''),
-                        order.get('Дата заказа', ''),
-                        order.get('Дата доставки', '')
-                    ))
+            reload_tree(tree)
         else:
             messagebox.showerror("Ошибка", "Не удалось загрузить историю заказов: имя пользователя отсутствует.")
     
@@ -953,28 +2959,61 @@ def create_order_history_frame():
 
 
 
-root = tk.Tk()
-root.title("Магазин")
-root.geometry("1430x600")
-
-frames = {
-    "registration": create_registration_frame(),
-    "authorization": create_authorization_frame(),
-    "company_dashboard": create_company_dashboard_frame(),
-    "client_dashboard": create_client_dashboard_frame(),
-    "orders": create_orders_frame(),
-    "products": create_products_frame(),
-    "add_product": create_add_product_frame(),
-    "buy_product": create_buy_product_frame(),
-    "profile": create_profile_frame(),
-    "order_status": create_order_status_frame(),
-    "order_history": create_order_history_frame(),
-}
+if __name__ == '__main__':
+    data_lock = acquire_data_lock()
+    if data_lock is None:
+        message = "Данные магазина уже открыты другим процессом (окном магазина или --watch)"
+        if not any(flag in sys.argv for flag in ('--migrate', '--gc-images', '--bench-thumbnails', '--watch')):
+            tk.Tk().withdraw()
+            messagebox.showerror("Ошибка", message)
+        sys.exit(message)
+    load_data()
+    if '--migrate' in sys.argv:
+        migrate_csv_to_sqlite()
+        sys.exit()
+    if '--gc-images' in sys.argv:
+        removed, freed = collect_orphan_images()
+        print(f"Удалено файлов: {removed}, освобождено {freed} байт")
+        sys.exit()
+    if '--bench-thumbnails' in sys.argv:
+        benchmark_thumbnails()
+        sys.exit()
+    if '--watch' in sys.argv:
+        # --watch ПАПКА [--company ID] [--upsert]
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+        watch_dir = sys.argv[sys.argv.index('--watch') + 1]
+        company_id = int(sys.argv[sys.argv.index('--company') + 1]) if '--company' in sys.argv else None
+        if company_id is not None and not any(company.id == company_id for company in companies):
+            sys.exit(f"Компания с ID {company_id} не найдена")
+        try:
+            watch_folder(watch_dir, company_id, '--upsert' in sys.argv)
+        except KeyboardInterrupt:
+            flush()
+        sys.exit()
+
+    root = tk.Tk()
+    root.title("Магазин")
+    root.geometry("1430x600")
+
+    frames = {
+        "registration": create_registration_frame(),
+        "authorization": create_authorization_frame(),
+        "company_dashboard": create_company_dashboard_frame(),
+        "client_dashboard": create_client_dashboard_frame(),
+        "orders": create_orders_frame(),
+        "products": create_products_frame(),
+        "add_product": create_add_product_frame(),
+        "buy_product": create_buy_product_frame(),
+        "profile": create_profile_frame(),
+        "order_status": create_order_status_frame(),
+        "order_history": create_order_history_frame(),
+    }
 
-for frame in frames.values():
-    frame.grid(row=0, column=0, sticky='nsew')
+    for frame in frames.values():
+        frame.grid(row=0, column=0, sticky='nsew')
 
-show_frame("authorization")
-center_window() 
+    show_frame("authorization")
+    center_window() 
 
-root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    flush()  # Дописываем отложенные изменения перед выходом